@@ -2,4 +2,9 @@
 Get base class for this manager
 """
 
-from .manager import TagManager
\ No newline at end of file
+def __getattr__(name):
+   "Import the window only when it is used, the base works without GUI"
+   if name == 'TagManager':
+      from .manager import TagManager
+      return TagManager
+   raise AttributeError(name)
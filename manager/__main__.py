@@ -0,0 +1,9 @@
+"""
+Command line interface, see cli
+"""
+
+import sys
+
+from .cli import main
+
+sys.exit(main())
@@ -0,0 +1,535 @@
+"""
+Time measurement for the database operations
+
+   python -m manager.benchmark run [-n 1000 100000] [-o result.json]
+   python -m manager.benchmark compare old.json new.json
+   python -m manager.benchmark copy [number of files]
+   python -m manager.benchmark stress [-w 4] [-r 2] [-n 300]
+   python -m manager.benchmark query [number of files]
+   python -m manager.benchmark migrations
+
+Synthetic catalogues (tag base and matching folder tree with empty
+files) are made in the work folder once and reused by the next runs.
+Tags have Zipf distribution, the random generator is seeded, so the
+same parameters give the same catalogue.
+
+Each operation is executed with warm caches (the same connection,
+after the first call) and cold caches (new connection, the base file
+is dropped from the OS cache when it is possible). The file system
+metadata cache can't be dropped without root rights, so folder reading
+is never completely cold.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import platform
+import argparse
+import sqlite3
+import tempfile
+import subprocess
+from itertools import accumulate
+from statistics import median
+
+from .tagbase import TagBase
+from .tagquery import parse
+from .migrations import upgrade, createBase, version, VERSION
+from .dirtree import SUBTREE
+
+FOLDER_SIZE = 200   # files in a regular folder
+FANOUT = 50         # subfolders in a folder
+ZIPF = 1.1          # exponent of the tag distribution
+MAX_TAGS = 5        # tags for one file
+BATCH = 50000       # files in one transaction
+SHARED = 20         # files tagged by all writers in stress test
+BULK = 10000        # new files with two tags each for bulk tagging, target is 1 s
+QUERIES = ('cat, (dog | bird)', 'NOT (dog | bird)', '!(cat, dog) | bird',
+           'cat, !(dog, !bird)', 'b*, NOT (in:/q/a | ext:txt)', '(cat | dog), (bird | ?file1)',
+           'NOT NOT cat', 'cat | dog | unknown', 'unknown, cat', 'NOT unknown, dog',
+           'cat, dog, NOT (bird | fish), in:/q', 'fish | (cat, NOT dog) | (bird, dog)', 'dog in:/q/b')
+OLD_FILES = [('/data/photo', 'cat.jpg', ['cat', 'pet']), ('/data/photo', 'dog.jpg', ['dog', 'pet']),
+             ('/data/photo/old', 'cat.jpg', ['cat']), ('/data/docs', 'report.pdf', ['work']),
+             ('/', 'root.txt', ['misc']), ('/data/docs', 'plan.txt', ['work', 'todo'])]
+# the same file written with other path, tags are merged
+OLD_COPIES = [('/data/docs/', 'plan.txt', ['todo', 'urgent'])]
+
+class Rollback(Exception):
+   "Cancel the changes of a measured operation"
+   pass
+
+def tagNumber(files):
+   "Default size of the tag vocabulary"
+   return max(100, int(5 * files ** 0.5))
+
+def makeCatalogue(root, files, tags, seed=1):
+   "Create folder tree and base, get parameters for the benchmark"
+   rnd = random.Random(seed)
+   names = ['tag%d' % i for i in range(tags)]
+   weights = list(accumulate(1.0 / (k + 1) ** ZIPF for k in range(tags)))
+   os.makedirs(root, exist_ok=True)
+   base = TagBase(os.path.join(root, 'tags.db'))
+   big = max(FOLDER_SIZE, files // 20)   # one large folder
+   items = []
+   for i in range(files):
+      if i < big:
+         path = os.path.join(root, 'tree', 'big')
+      else:
+         k = (i - big) // FOLDER_SIZE
+         path = os.path.join(root, 'tree', 'a%d' % (k // FANOUT), 'b%d' % (k % FANOUT))
+      nm = 'file%d.%s' % (i, ('txt', 'pdf', 'jpg', 'png')[i % 4])
+      if not items or items[-1][0] != path: os.makedirs(path, exist_ok=True)
+      os.close(os.open(os.path.join(path, nm), os.O_CREAT | os.O_WRONLY, 0o644))
+      tg = set(rnd.choices(names, cum_weights=weights, k=rnd.randint(1, MAX_TAGS)))
+      items.append((path, nm, list(tg)))
+      if len(items) == BATCH:
+         with base.transaction(): base.tagsToFiles(items)
+         items = []
+   with base.transaction(): base.tagsToFiles(items)
+   base.close()
+
+def catalogue(work, files, tags, seed):
+   "Get folder with the catalogue, make it if need"
+   root = os.path.join(work, 'cat-%d-%d-%d' % (files, tags, seed))
+   if not os.path.exists(os.path.join(root, 'ready')):
+      t = time.perf_counter()
+      makeCatalogue(root, files, tags, seed)
+      # mark as complete
+      with open(os.path.join(root, 'ready'), 'w') as f:
+         f.write("%.1f s\n" % (time.perf_counter() - t))
+   return root
+
+def dropCache(fname):
+   "Remove file from the OS page cache"
+   if not hasattr(os, 'posix_fadvise'): return
+   for name in (fname, fname + '-wal'):
+      if not os.path.exists(name): continue
+      fd = os.open(name, os.O_RDONLY)
+      try:
+         os.fsync(fd)
+         os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+      finally:
+         os.close(fd)
+
+def undo(base, fn, *args):
+   "Execute modification and cancel it"
+   try:
+      with base.transaction():
+         fn(*args)
+         raise Rollback()
+   except Rollback:
+      pass
+
+def operations(root, seed):
+   "Get {name: function(base)} for measurement"
+   # queries are defined once, so cold and warm runs do the same
+   base = TagBase(os.path.join(root, 'tags.db'))
+   cursor = base.db.cursor()
+   cursor.execute("SELECT t_name FROM tags ORDER BY t_usage DESC")
+   tags = [t[0] for t in cursor.fetchall()]
+   cursor.execute("SELECT MAX(fid) FROM files")
+   last = cursor.fetchone()[0]
+   rnd = random.Random(seed)
+   fids = [rnd.randint(1, last) for i in range(1000)]
+   sample = base.filesById(fids)
+   base.close()
+   big = os.path.join(root, 'tree', 'big')
+   folder = os.path.join(root, 'tree', 'a0')
+   common, second, rare = tags[0], tags[1], tags[len(tags) // 2]
+   bulk = [(os.path.join(root, 'bulk', 'd%d' % (i // FOLDER_SIZE)), 'new%d.txt' % i,
+            [tags[i % len(tags)], tags[(i + 1) % len(tags)]]) for i in range(BULK)]
+
+   def fileTags(base):
+      for path, nm in sample: base.getFileTags(path, nm)
+
+   def readFolder(base):
+      # file list part of FileList.writeFiles, without widgets
+      from .filelist import readDir
+      readDir(big)
+
+   def firstPart(base):
+      # rows shown before the whole folder is read
+      from .filelist import readParts
+      next(readParts(big))
+
+   def sortFolder(base):
+      # the same keys as FileList.sort
+      from .filelist import readDir
+      dirs, files = readDir(big)
+      for key in (lambda x: x.name, lambda x: x.size, lambda x: x.ext, lambda x: x.mtime):
+         files.sort(key=key)
+         files.sort(key=key, reverse=True)
+
+   return {
+      'findFiles common': lambda base: base.findFiles([common]),
+      'findFiles rare': lambda base: base.findFiles([rare]),
+      'findFiles pair': lambda base: base.findFiles([common, second]),
+      'query and-not': lambda base: base.query("%s, NOT %s" % (common, second)),
+      'findByName': lambda base: base.findByName('file12'),
+      'getFileTags x1000': fileTags,
+      'getDirTags big': lambda base: base.getDirTags(big),
+      'tagsToFiles 10k': lambda base: undo(base, base.tagsToFiles, bulk),
+      'delFolder': lambda base: undo(base, base.delFolder, folder),
+      'addDirCopy': lambda base: undo(base, base.addDirCopy, folder + '_copy', folder),
+      'correct': lambda base: list(base.correct()),
+      'correct incremental': lambda base: list(base.correct(True)),
+      'FileList first big': firstPart,
+      'FileList read big': readFolder,
+      'FileList sort big': sortFolder,
+   }
+
+def measure(fn, base, repeat):
+   "List of execution times for the operation"
+   res = []
+   for i in range(repeat):
+      t = time.perf_counter()
+      fn(base)
+      res.append(time.perf_counter() - t)
+   return res
+
+def summary(times):
+   "Statistics for the list of times"
+   return {'min': min(times), 'median': median(times), 'runs': times}
+
+def runCatalogue(root, seed, repeat):
+   "Measure all operations for the catalogue"
+   db = os.path.join(root, 'tags.db')
+   res = {}
+   for name, fn in operations(root, seed).items():
+      # cold: new connection each time
+      cold = []
+      for i in range(repeat):
+         dropCache(db)
+         base = TagBase(db)
+         cold += measure(fn, base, 1)
+         base.close()
+      # warm: the first call fills caches
+      base = TagBase(db)
+      fn(base)
+      warm = measure(fn, base, repeat)
+      base.close()
+      res[name] = {'cold': summary(cold), 'warm': summary(warm)}
+      print("  %-22s cold %9.4f  warm %9.4f" % (name, min(cold), min(warm)), file=sys.stderr)
+   return res
+
+def commitId():
+   "Current git commit or None"
+   try:
+      return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                            text=True, cwd=os.path.dirname(__file__)).stdout.strip() or None
+   except OSError:
+      return None
+
+def run(args):
+   "Benchmark for the list of catalogue sizes"
+   work = args.dir or os.path.join(tempfile.gettempdir(), 'tagmanager-bench')
+   report = {
+      'commit': commitId(),
+      'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+      'python': platform.python_version(),
+      'sqlite': sqlite3.sqlite_version,
+      'platform': platform.platform(),
+      'seed': args.seed,
+      'repeat': args.repeat,
+      'catalogues': [],
+   }
+   for n in args.files:
+      tags = args.tags or tagNumber(n)
+      print("%d files, %d tags" % (n, tags), file=sys.stderr)
+      root = catalogue(work, n, tags, args.seed)
+      report['catalogues'].append({'files': n, 'tags': tags,
+                                   'results': runCatalogue(root, args.seed, args.repeat)})
+   out = open(args.out, 'w') if args.out != '-' else sys.stdout
+   json.dump(report, out, indent=1)
+   if out is not sys.stdout: out.close()
+
+def compare(args):
+   "Print ratio of the minimal warm and cold times"
+   with open(args.old) as f: old = json.load(f)
+   with open(args.new) as f: new = json.load(f)
+   print("%s -> %s" % (old.get('commit'), new.get('commit')))
+   prev = {c['files']: c['results'] for c in old['catalogues']}
+   for cat in new['catalogues']:
+      res = prev.get(cat['files'])
+      if res is None: continue
+      print("%d files" % cat['files'])
+      for name, r in cat['results'].items():
+         if name not in res: continue
+         ratio = [r[k]['min'] / max(res[name][k]['min'], 1e-9) for k in ('cold', 'warm')]
+         print("  %-22s cold x%.2f  warm x%.2f" % ((name,) + tuple(ratio)))
+
+def fillBase(base, root, files, tags=50, folders=100):
+   "Add tagged files into the folder tree"
+   names = ['tag%d' % i for i in range(tags)]
+   items = []
+   for i in range(files):
+      path = os.path.join(root, 'd%d' % (i % folders), 's%d' % (i % 7))
+      items.append((path, 'file%d.txt' % i, random.sample(names, 3)))
+   with base.transaction():
+      base.tagsToFiles(items)
+
+def copyLoop(base, dst_path, src_path):
+   "Copy directory file by file, as it was before set-based copy"
+   cursor = base.db.cursor()
+   did = base.dirs.find(src_path)
+   cursor.execute("SELECT did, f_name FROM files WHERE " + SUBTREE, (did,))
+   for path, nm in base.dirs.named(cursor.fetchall()):
+      tags = base.getFileTags(path, nm)
+      if tags:
+         base.tagsToFile(dst_path + path[len(src_path):], nm, tags)
+
+def timeIt(fn, *args):
+   "Execution time in seconds"
+   t = time.perf_counter()
+   fn(*args)
+   return time.perf_counter() - t
+
+def compareCopy(files):
+   "Copy of tagged folder: old loop against INSERT ... SELECT"
+   res = {}
+   with tempfile.TemporaryDirectory() as tmp:
+      for key in ('loop', 'set'):
+         base = TagBase(os.path.join(tmp, key + '.db'))
+         fillBase(base, '/data/src', files)
+         if key == 'loop':
+            res[key] = timeIt(copyLoop, base, '/data/dst', '/data/src')
+         else:
+            res[key] = timeIt(base.addDirCopy, '/data/dst', '/data/src')
+         base.close()
+   return res
+
+def copy(args):
+   "Print result of compareCopy"
+   res = compareCopy(args.files)
+   print("Copy folder with %d files" % args.files)
+   print("   loop: %.3f s" % res['loop'])
+   print("   set:  %.3f s (x%.1f)" % (res['set'], res['loop'] / max(res['set'], 1e-9)))
+
+def matches(node, path, nm, tags):
+   "Check the query syntax tree for one file without SQL"
+   kind, val = node
+   if kind == 'tag': return val in tags
+   if kind == 'prefix': return any(t.startswith(val) for t in tags)
+   if kind == 'in': return path == val or path.startswith(val + '/')
+   if kind == 'ext': return nm.lower().endswith('.' + val)
+   if kind == 'name': return val.lower() in nm.lower()
+   if kind == 'not': return not matches(val, path, nm, tags)
+   if kind == 'and': return all(matches(n, path, nm, tags) for n in val)
+   return any(matches(n, path, nm, tags) for n in val)
+
+def checkQueries(files):
+   "Get list of queries which results differ from the direct check"
+   rnd = random.Random(1)
+   names = ['cat', 'dog', 'bird', 'fish', 'bat']
+   items = [('/q/%s' % rnd.choice('abc'), 'file%d.%s' % (i, rnd.choice(('txt', 'jpg'))),
+             rnd.sample(names, rnd.randint(1, 3))) for i in range(files)]
+   res = []
+   with tempfile.TemporaryDirectory() as tmp:
+      base = TagBase(os.path.join(tmp, 'query.db'))
+      with base.transaction(): base.tagsToFiles(items)
+      for q in QUERIES:
+         node = parse(q)
+         want = sorted((p, nm) for p, nm, tags in items if matches(node, p, nm, set(tags)))
+         got = sorted(base.query(q))
+         if got != want:
+            res.append("%s: %d files instead of %d" % (q, len(got), len(want)))
+      base.close()
+   return res
+
+def query(args):
+   "Print queries with wrong results"
+   problems = checkQueries(args.files)
+   print("%d queries on %d files" % (len(QUERIES), args.files))
+   for p in problems: print("   ERROR", p)
+   return 1 if problems else 0
+
+def oldBase(fname, n):
+   "Make base with schema version n and tagged files"
+   db = sqlite3.connect(fname)
+   cursor = db.cursor()
+   if n == 0:
+      createBase(cursor)   # tables of the program without versions
+      db.commit()
+   else:
+      upgrade(db, n)
+   cursor.execute("PRAGMA foreign_keys = ON")
+   for path, nm, tags in OLD_FILES + OLD_COPIES + [('/data/tmp', 'gone.txt', ['gone'])]:
+      cursor.execute("INSERT INTO files (f_name, f_path) VALUES (?, ?)", (nm, path))
+      fid = cursor.lastrowid
+      for t in tags:
+         cursor.execute("INSERT OR IGNORE INTO tags (t_name) VALUES (?)", (t,))
+         cursor.execute("INSERT INTO filetags SELECT ?, tid FROM tags WHERE t_name=?", (fid, t))
+   cursor.execute("DELETE FROM files WHERE f_name='gone.txt'")
+   db.commit()
+   db.close()
+
+def checkUpgrade(fname):
+   "Get list of problems in the upgraded base"
+   base = TagBase(fname)
+   cur = base.db.cursor()
+   res = []
+   if version(base.db) != VERSION: res.append("version %d" % version(base.db))
+   if cur.execute("PRAGMA integrity_check").fetchone()[0] != 'ok':
+      res.append("integrity check failed")
+   if cur.execute("PRAGMA foreign_key_check").fetchall():
+      res.append("broken foreign keys")
+   for path, nm, tags in OLD_FILES:
+      tags = set(tags).union(*(c[2] for c in OLD_COPIES if c[0].rstrip(os.sep) == path and c[1] == nm))
+      got = sorted(base.getFileTags(path, nm))
+      if got != sorted(tags): res.append("%s: %s" % (os.path.join(path, nm), got))
+   cur.execute("SELECT t_name, t_usage, (SELECT COUNT(*) FROM filetags ft "
+               "WHERE ft.tid = tags.tid) FROM tags")
+   res += ["tag %s: usage %d, links %d" % r for r in cur.fetchall() if r[1] != r[2]]
+   if len(base.query('pet')) != 2: res.append("search by tag")
+   if base.fts and len(base.findByName('report')) != 1: res.append("search by name")
+   base.close()
+   return res
+
+def migrations(args):
+   "Upgrade bases of all the old versions"
+   problems = []
+   with tempfile.TemporaryDirectory() as tmp:
+      for n in range(VERSION):
+         fname = os.path.join(tmp, 'v%d.db' % n)
+         oldBase(fname, n)
+         try:
+            problems += ["version %d: %s" % (n, p) for p in checkUpgrade(fname)]
+         except Exception as e:
+            problems.append("version %d: %r" % (n, e))
+   print("Upgrade from versions 0..%d to %d" % (VERSION - 1, VERSION))
+   for p in problems: print("   ERROR", p)
+   return 1 if problems else 0
+
+def stressWriter(db, n, files, out):
+   "Tag files in own and shared folder, add and remove temporary files"
+   base = TagBase(db)
+   slowest, retried = 0.0, 0
+   try:
+      for i in range(files):
+         t = time.perf_counter()
+         base.retry(base.tagsToFiles, [('/stress/w%d' % n, 'f%d' % i, ['w%d' % n, 'common']),
+                                       ('/stress/shared', 'f%d' % (i % SHARED), ['s%d' % n]),
+                                       ('/stress/tmp', 'w%d' % n, ['tmp'])])
+         base.retry(base.delFile, '/stress/tmp', 'w%d' % n)
+         slowest = max(slowest, time.perf_counter() - t)
+      out.put(('writer', n, None, slowest))
+   except Exception as e:
+      out.put(('writer', n, repr(e), slowest))
+   finally:
+      base.close()
+
+def stressReader(db, n, stop, out):
+   "Search with pool connections in two threads, number of files must grow"
+   import threading
+   base = TagBase(db)
+   errors, reads = [], [0]
+
+   def loop():
+      last = 0
+      while not stop.is_set():
+         try:
+            with base.reading() as rb:
+               found = len(rb.findFiles(['common']))
+               rb.getDirTags('/stress/shared')
+               rb.query('common, NOT tmp')
+         except Exception as e:
+            errors.append(repr(e))
+            return
+         if found < last: errors.append("files lost: %d < %d" % (found, last))
+         last = found
+         reads[0] += 1
+
+   threads = [threading.Thread(target=loop) for i in range(2)]
+   for th in threads: th.start()
+   for th in threads: th.join()
+   base.close()
+   out.put(('reader', n, '; '.join(errors[:3]) or None, reads[0]))
+
+def checkStress(db, writers, files):
+   "Get list of problems in the base after stress test"
+   base = TagBase(db)
+   cur = base.db.cursor()
+   res = []
+   if cur.execute("PRAGMA integrity_check").fetchone()[0] != 'ok':
+      res.append("integrity check failed")
+   if cur.execute("PRAGMA foreign_key_check").fetchall():
+      res.append("broken foreign keys")
+   for t, usage in cur.execute("SELECT t_name, t_usage FROM tags").fetchall():
+      links = cur.execute("SELECT COUNT(*) FROM filetags JOIN tags USING (tid) "
+                          "WHERE t_name=?", (t,)).fetchone()[0]
+      if links != usage: res.append("tag %s: usage %d, links %d" % (t, usage, links))
+   if base.tagId('tmp') != -1: res.append("unused tag is not removed")
+   for n in range(writers):
+      got = len(base.findFiles(['w%d' % n, 'common']))
+      if got != files: res.append("writer %d: %d files instead of %d" % (n, got, files))
+   shared = base.getDirTags('/stress/shared')
+   for nm, tags in shared.items():
+      if len(tags) != writers: res.append("shared %s: %s" % (nm, sorted(tags)))
+   base.close()
+   return res
+
+def stress(args):
+   "Writers and readers in separate processes on the same base"
+   import multiprocessing as mp
+   ctx = mp.get_context('spawn')
+   with tempfile.TemporaryDirectory() as tmp:
+      db = os.path.join(tmp, 'stress.db')
+      TagBase(db).close()   # schema
+      out, stop = ctx.Queue(), ctx.Event()
+      readers = [ctx.Process(target=stressReader, args=(db, n, stop, out))
+                 for n in range(args.readers)]
+      writers = [ctx.Process(target=stressWriter, args=(db, n, args.files, out))
+                 for n in range(args.writers)]
+      t = time.perf_counter()
+      for p in readers + writers: p.start()
+      results = [out.get() for p in writers]
+      dt = time.perf_counter() - t
+      stop.set()
+      results += [out.get() for p in readers]
+      for p in readers + writers: p.join()
+      problems = [("%s %d: %s" % r[:3]) for r in results if r[2]]
+      problems += checkStress(db, args.writers, args.files)
+   transactions = 2 * args.writers * args.files
+   print("%d writers, %d readers, %.1f s" % (args.writers, args.readers, dt))
+   print("   writes: %.0f transactions/s, slowest %.3f s" %
+         (transactions / dt, max(r[3] for r in results if r[0] == 'writer')))
+   print("   reads:  %d searches" % sum(r[3] for r in results if r[0] == 'reader'))
+   for p in problems: print("   ERROR", p)
+   return 1 if problems else 0
+
+def parser():
+   "Command line arguments"
+   p = argparse.ArgumentParser(prog='python -m manager.benchmark')
+   sub = p.add_subparsers(dest='command', required=True)
+   c = sub.add_parser('run', help="measure operations on synthetic catalogues")
+   c.add_argument('-n', '--files', type=int, nargs='+', default=[1000, 10000, 100000],
+                  help="catalogue sizes, from 1000 to 1000000")
+   c.add_argument('-t', '--tags', type=int, help="number of tags, depends on size by default")
+   c.add_argument('-r', '--repeat', type=int, default=5)
+   c.add_argument('-s', '--seed', type=int, default=1)
+   c.add_argument('-d', '--dir', help="work folder for catalogues")
+   c.add_argument('-o', '--out', default='-', help="JSON file for results")
+   c.set_defaults(run=run)
+   c = sub.add_parser('compare', help="compare two JSON results")
+   c.add_argument('old')
+   c.add_argument('new')
+   c.set_defaults(run=compare)
+   c = sub.add_parser('copy', help="folder copy: file by file against INSERT ... SELECT")
+   c.add_argument('files', type=int, nargs='?', default=30000)
+   c.set_defaults(run=copy)
+   c = sub.add_parser('query', help="boolean queries against direct check")
+   c.add_argument('files', type=int, nargs='?', default=2000)
+   c.set_defaults(run=query)
+   c = sub.add_parser('migrations', help="upgrade bases of all the old schema versions")
+   c.set_defaults(run=migrations)
+   c = sub.add_parser('stress', help="several processes on the same base")
+   c.add_argument('-w', '--writers', type=int, default=4)
+   c.add_argument('-r', '--readers', type=int, default=2)
+   c.add_argument('-n', '--files', type=int, default=300, help="files for each writer")
+   c.set_defaults(run=stress)
+   return p
+
+if __name__ == "__main__":
+   args = parser().parse_args()
+   sys.exit(args.run(args))
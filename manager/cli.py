@@ -0,0 +1,146 @@
+"""
+Command line interface for the tag base
+
+   python -m manager [--db FILE] [--profile] COMMAND ...
+
+   tag -t a,b FILE...     add tags to files
+   untag -t a,b FILE...   remove tags, all of them without -t
+   find QUERY             search with tag query, see tagquery
+   name WORD...           search by part of name
+   correct [-i]           remove files which are no more exist
+   stats                  number of files and the most used tags
+   export [FILE]          write 'tags<TAB>path' lines
+   import [FILE]          read lines written by export
+"""
+
+import os
+import sys
+import argparse
+
+from .core import openBase
+
+def splitTags(text):
+   "Tags from comma separated string"
+   return [t.strip().lower() for t in text.split(',') if t.strip()]
+
+def splitPath(fname):
+   "Get (folder, name) for the file"
+   return os.path.split(os.path.abspath(fname))
+
+def tag(base, args):
+   "Add tags to files"
+   tags = splitTags(args.tags)
+   base.retry(base.tagsToFiles, [splitPath(f) + (tags,) for f in args.files])
+
+def untag(base, args):
+   "Remove tags from files"
+   base.retry(untagFiles, base, args)
+
+def untagFiles(base, args):
+   "Remove tags inside transaction"
+   for f in args.files:
+      path, nm = splitPath(f)
+      if args.tags:
+         base.breakLinks(path, nm, splitTags(args.tags))
+      else:
+         base.delFile(path, nm)
+
+def find(base, args):
+   "Print files for the query"
+   show(base.query(' '.join(args.query)))
+
+def name(base, args):
+   "Print files with the words in name"
+   show(base.findByName(' '.join(args.words)))
+
+def correct(base, args):
+   "Remove missing files"
+   for checked, total in base.correct(args.incremental):
+      if args.verbose: print("Folders: %d / %d" % (checked, total), file=sys.stderr)
+
+def stats(base, args):
+   "Print base information"
+   print(base.baseInfo())
+   cursor = base.db.cursor()
+   cursor.execute("SELECT t_name, t_usage FROM tags ORDER BY t_usage DESC LIMIT ?", (args.top,))
+   for t, n in cursor.fetchall():
+      print("%8d  %s" % (n, t))
+
+def export(base, args):
+   "Write tags of all files"
+   out = open(args.file, 'w') if args.file != '-' else sys.stdout
+   try:
+      for path, nm, tags in base.allFiles():
+         out.write("%s\t%s\n" % (','.join(tags), os.path.join(path, nm)))
+   finally:
+      if out is not sys.stdout: out.close()
+
+def load(base, args):
+   "Read tags of files"
+   inp = open(args.file) if args.file != '-' else sys.stdin
+   try:
+      items = []
+      for line in inp:
+         line = line.rstrip('\n')
+         if not line: continue
+         tags, fname = line.split('\t', 1)
+         items.append(splitPath(fname) + (splitTags(tags),))
+   finally:
+      if inp is not sys.stdin: inp.close()
+   base.retry(base.tagsToFiles, items)
+
+def show(files):
+   "Print list of (path, name)"
+   for path, nm in files:
+      print(os.path.join(path, nm))
+
+def parser():
+   "Command line arguments"
+   p = argparse.ArgumentParser(prog='python -m manager', description="Tag base without GUI")
+   p.add_argument('--db', help="database file")
+   p.add_argument('--profile', action='store_true', help="print query statistics to stderr")
+   sub = p.add_subparsers(dest='command', required=True)
+   c = sub.add_parser('tag', help="add tags to files")
+   c.add_argument('-t', '--tags', required=True, help="comma separated tags")
+   c.add_argument('files', nargs='+')
+   c.set_defaults(run=tag)
+   c = sub.add_parser('untag', help="remove tags from files")
+   c.add_argument('-t', '--tags', help="comma separated tags, all if not given")
+   c.add_argument('files', nargs='+')
+   c.set_defaults(run=untag)
+   c = sub.add_parser('find', help="search with tag query")
+   c.add_argument('query', nargs='+')
+   c.set_defaults(run=find)
+   c = sub.add_parser('name', help="search by part of file name")
+   c.add_argument('words', nargs='+')
+   c.set_defaults(run=name)
+   c = sub.add_parser('correct', help="remove files which are no more exist")
+   c.add_argument('-i', '--incremental', action='store_true', help="only changed folders")
+   c.add_argument('-v', '--verbose', action='store_true')
+   c.set_defaults(run=correct)
+   c = sub.add_parser('stats', help="base information")
+   c.add_argument('--top', type=int, default=10, help="number of tags to show")
+   c.set_defaults(run=stats)
+   c = sub.add_parser('export', help="write 'tags<TAB>path' lines")
+   c.add_argument('file', nargs='?', default='-')
+   c.set_defaults(run=export)
+   c = sub.add_parser('import', help="read 'tags<TAB>path' lines")
+   c.add_argument('file', nargs='?', default='-')
+   c.set_defaults(run=load)
+   return p
+
+def main(argv=None):
+   "Execute command"
+   args = parser().parse_args(argv)
+   base = openBase(args.db)
+   if args.profile: base.profile()
+   try:
+      args.run(base, args)
+   except ValueError as e:
+      # wrong query
+      print("Error:", e, file=sys.stderr)
+      return 1
+   finally:
+      if args.profile: print(base.profileReport(), file=sys.stderr)
+      base.close()
+   return 0
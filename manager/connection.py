@@ -0,0 +1,97 @@
+"""
+SQLite connections for several threads and processes
+
+The writer works in WAL mode, so readers don't wait for it. Writes
+begin with BEGIN IMMEDIATE and wait for the lock up to BUSY_TIMEOUT,
+when it is not enough the whole transaction can be repeated, see
+TagBase.retry(). Read-only connections for background threads are
+taken from ReadPool.
+"""
+
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+BUSY_TIMEOUT = 5.0   # s, wait for the lock of the other process
+RETRIES = 5          # repeat transaction when the base is locked
+BACKOFF = 0.05       # s, first pause between retries, doubled each time
+
+def connect(db_name, readonly=False, timeout=BUSY_TIMEOUT):
+   "Open connection, readers can be used from other threads"
+   if readonly:
+      db = sqlite3.connect(db_name, timeout=timeout, check_same_thread=False)
+      db.execute("PRAGMA query_only = ON")
+      return db
+   # take write lock at the first modification, not at commit
+   db = sqlite3.connect(db_name, timeout=timeout, isolation_level='IMMEDIATE')
+   try:
+      # stored in file, 'memory' for in-memory base
+      db.execute("PRAGMA journal_mode = WAL")
+      db.execute("PRAGMA synchronous = NORMAL")
+   except sqlite3.OperationalError:
+      pass   # opened by program without WAL, keep old mode
+   return db
+
+def isBusy(e):
+   "Base is locked by other connection"
+   return isinstance(e, sqlite3.OperationalError) and (
+          'locked' in str(e) or 'busy' in str(e))
+
+class DataVersion:
+   "Find changes committed by other connections"
+
+   def __init__(self, db):
+      self.db = db
+      self.last = self.read()
+
+   def read(self):
+      return self.db.execute("PRAGMA data_version").fetchone()[0]
+
+   def changed(self, locked=False):
+      "True if base was changed since the last call, check it once after lock"
+      if self.db.in_transaction and not locked: return False
+      v = self.read()
+      if v == self.last: return False
+      self.last = v
+      return True
+
+class ReadPool:
+   "Limited number of connections, each is used by one thread at a time"
+
+   def __init__(self, factory, size):
+      self.factory = factory   # make new connection
+      self.size = size
+      self.free = queue.LifoQueue()
+      self.count = 0
+      self.lock = threading.Lock()
+
+   @contextmanager
+   def get(self):
+      "Take connection, wait if all of them are in use"
+      try:
+         item = self.free.get_nowait()
+      except queue.Empty:
+         with self.lock:
+            new = self.count < self.size
+            if new: self.count += 1
+         if new:
+            try:
+               item = self.factory()
+            except:
+               with self.lock: self.count -= 1
+               raise
+         else:
+            item = self.free.get()
+      try:
+         yield item
+      finally:
+         self.free.put(item)
+
+   def close(self):
+      "Close free connections"
+      while True:
+         try:
+            self.free.get_nowait().close()
+         except queue.Empty:
+            break
@@ -0,0 +1,25 @@
+"""
+Access to the tag base without graphical interface
+"""
+
+import os
+
+from .tagbase import TagBase
+
+DB_ENV = 'TAGMANAGER_DB'   # environment variable with database path
+DEFAULT_DB = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'db', 'tags.db')
+
+def dbPath(path=None):
+   "Database file: argument, environment, tmconfig.db_path or default"
+   if path: return path
+   path = os.environ.get(DB_ENV)
+   if path: return path
+   try:
+      from tmconfig import db_path
+   except ImportError:
+      db_path = None
+   return db_path or DEFAULT_DB
+
+def openBase(path=None, vocab=None):
+   "Open the tag base"
+   return TagBase(dbPath(path), vocab)
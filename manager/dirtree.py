@@ -0,0 +1,98 @@
+"""
+Folders as a tree in the database
+"""
+
+import os
+from functools import lru_cache
+
+from .connection import DataVersion
+
+# files in the folder with given did and all its subfolders
+SUBTREE = ("did IN (WITH RECURSIVE sub(id) AS (VALUES(?) UNION ALL "
+           "SELECT d.did FROM dirs d JOIN sub ON d.parent = sub.id) SELECT id FROM sub)")
+
+ROOT = 0        # parent of the top level folders
+CACHE = 4096    # number of saved paths
+
+def split(path):
+   "Get list of folder names"
+   return path.rstrip(os.sep).split(os.sep)
+
+class DirTree:
+   "Table dirs (did, parent, name) with cached path resolution"
+
+   def __init__(self, db):
+      self.db = db
+      self.ids = {}   # path : did
+      self.version = DataVersion(db)   # other process can change folders
+      self.path = lru_cache(maxsize=CACHE)(self.readPath)
+
+   def readPath(self, did):
+      "Get full path for the folder id"
+      cursor = self.db.cursor()
+      cursor.execute("SELECT parent, name FROM dirs WHERE did=?", (did,))
+      parent, name = cursor.fetchone()
+      if parent == ROOT:
+         return name + os.sep   # '/' or 'C:\'
+      return os.path.join(self.path(parent), name)
+
+   def find(self, path, create=False):
+      "Get folder id, -1 if not found"
+      if self.version.changed(): self.clear()
+      did = self.ids.get(path)
+      if did is not None: return did
+      cursor = self.db.cursor()
+      did = ROOT
+      for name in split(path):
+         cursor.execute("SELECT did FROM dirs WHERE parent=? AND name=?", (did, name))
+         res = cursor.fetchone()
+         if res:
+            did = res[0]
+         elif create:
+            # can be added by other process after SELECT
+            cursor.execute("INSERT OR IGNORE INTO dirs (parent, name) VALUES (?, ?)", (did, name))
+            cursor.execute("SELECT did FROM dirs WHERE parent=? AND name=?", (did, name))
+            did = cursor.fetchone()[0]
+         else:
+            return -1
+      if len(self.ids) > CACHE: self.ids.clear()
+      self.ids[path] = did
+      return did
+
+   def named(self, rows):
+      "Replace folder id-s with paths in (did, name) list"
+      if self.version.changed(): self.clear()
+      return [(self.path(did), nm) for did, nm in rows]
+
+   def move(self, did, new_path):
+      "Change parent and name of the folder"
+      parent, name = os.path.split(new_path.rstrip(os.sep))
+      self.db.cursor().execute("UPDATE dirs SET parent=?, name=? WHERE did=?",
+                               (self.find(parent, True), name, did))
+      self.clear()
+
+   def copy(self, did, new_path):
+      "Repeat folder structure in the new place, get {old did: new did}"
+      cursor = self.db.cursor()
+      res = {did: self.find(new_path, True)}
+      cursor.execute("WITH RECURSIVE sub(id, lvl) AS (VALUES(?, 0) UNION ALL "
+                     "SELECT d.did, lvl+1 FROM dirs d JOIN sub ON d.parent = sub.id) "
+                     "SELECT d.did, d.parent, d.name FROM sub JOIN dirs d ON d.did = sub.id "
+                     "WHERE lvl > 0 ORDER BY lvl", (did,))
+      # parents go before children
+      for sub, parent, name in cursor.fetchall():
+         cursor.execute("INSERT OR IGNORE INTO dirs (parent, name) VALUES (?, ?)",
+                        (res[parent], name))
+         cursor.execute("SELECT did FROM dirs WHERE parent=? AND name=?", (res[parent], name))
+         res[sub] = cursor.fetchone()[0]
+      return res
+
+   def remove(self, did):
+      "Delete folder with its content"
+      self.db.cursor().execute("DELETE FROM dirs WHERE did=?", (did,))
+      self.clear()
+
+   def clear(self):
+      "Forget saved paths"
+      self.ids.clear()
+      self.path.cache_clear()
@@ -4,12 +4,70 @@ Represent list of files as a panel
 
 import os
 import time
+import threading
+import queue
 from tkinter import ttk
 from tkinter import Frame, Label, StringVar, Entry, PhotoImage
 
+from .watcher import ADD, RELOAD
+from .vocabulary import Completer
+
 NAME, TYPE, SIZE, DATE = 'Name', 'Type', 'Size', 'Date'
 PREVIOUS_DIR = "  ..  "
 INIT_PATH = ".."
+CHUNK = 300   # rows inserted into the list at once
+
+class FileInfo:
+   "Properties of directory element"
+   __slots__ = ('name', 'is_dir', 'size', 'mtime', 'ext')
+
+   def __init__(self, name, is_dir, stat):
+      self.name = name
+      self.is_dir = is_dir
+      self.size = stat.st_size
+      self.mtime = stat.st_mtime
+      self.ext = '' if is_dir else os.path.splitext(name)[1]
+
+def entryInfo(entry):
+   "Get FileInfo from os.DirEntry"
+   try:
+      return FileInfo(entry.name, entry.is_dir(), entry.stat())
+   except OSError:
+      # broken link
+      return FileInfo(entry.name, False, entry.stat(follow_symlinks=False))
+
+def pathInfo(path, name):
+   "Get FileInfo for the name in folder, None if not exists"
+   full = os.path.join(path, name)
+   try:
+      stat = os.stat(full)
+   except OSError:
+      try:
+         stat = os.lstat(full)
+      except OSError:
+         return None
+   return FileInfo(name, os.path.isdir(full), stat)
+
+def readParts(path, first=CHUNK):
+   "Get lists of folders and files for the first elements, then for the rest"
+   dirs, files = [], []
+   with os.scandir(path) as it:
+      for entry in it:
+         if entry.name.startswith('.'): continue
+         info = entryInfo(entry)
+         (dirs if info.is_dir else files).append(info)
+         if len(dirs) + len(files) == first:
+            yield dirs, files
+            dirs, files = [], []
+   yield dirs, files
+
+def readDir(path):
+   "Get lists of folders and files, hidden elements are skipped"
+   dirs, files = [], []
+   for d, f in readParts(path):
+      dirs += d
+      files += f
+   return dirs, files
 
 class FileList(Frame):
    "File representation as list with properties"
@@ -57,6 +115,9 @@ class FileList(Frame):
       self.list.bind('<F7>', self.newDir)
       self.list.bind('<Delete>', self.remove)
       self.list.bind('<Left>', self.previousDirectory)
+      self.list.bind('<Escape>', lambda x: self.fo.transfers.cancel())
+      self.list.bind('<Insert>', self.toggleSelect)
+      self.list.bind('<Control-a>', self.selectAll)
       self.list.bind('<KeyPress>', self.quickSearch)
       self.list.bind('<<TreeviewSelect>>', lambda x: self.bufReset())
       self.taglist.bind('<Double-ButtonRelease-1>', self.tagEdit)
@@ -78,11 +139,22 @@ class FileList(Frame):
       # class for file operations
       self.fo = fileOp
       # autocompleting
-      self.last_tag = ""
-      self.last_tag_lst = []
-      self.last_tag_num = 0
+      self.completer = Completer(fileOp.vocab)
       self.position = None
-      self.hash = 0
+      self.selected = ()   # selection of inactive panel
+      self.select_all = False   # rows are selected when inserted
+      self.marked = []   # files for tag edition
+      # folder content
+      self.mtime = None
+      self.path_dir, self.path_file, self.path_tags = [], [], {}
+      self.rows, self.inserted = [], 0
+      self.dir_order = self.file_order = (lambda x: x.name, False)   # current sorting
+      self.changes = []   # file system events during reading
+      self.status = ""    # copy/move progress
+      # background reading
+      self.loaded = queue.Queue()
+      self.loading = 0   # index of the last request
+      self.waiting = 0   # number of running threads
       # images for elements
       self.folder_img = PhotoImage(file="./manager/img/folder.gif")
       self.file_img = PhotoImage(file="./manager/img/file.gif")
@@ -91,31 +163,88 @@ class FileList(Frame):
       # fill panel
       self.writeFiles(abspath)
 
-   def writeFiles(self, path,focus=None):
-      "Show list of files in current path"
+   def writeFiles(self, path, focus=None, done=None, keep=False):
+      "Show list of files in current path, keep rows to update only the difference"
+      keep = keep and path == self.getPath()
       self.dir_var.set(path)
-      # read files
-      self.path_dir = []
-      self.path_file = []
-      self.hash = 0
-      for p in os.listdir(path):
-         if p.startswith('.'): continue    # hidden files
-         if os.path.isdir(os.path.join(path,p)):
-            self.path_dir.append(p)
-         else:
-            self.path_file.append(p)
-         self.hash += hash(p)
-      # read tags from base
-      self.path_tags = {}
-      for f in self.path_file:
-         self.path_tags[f] = self.fo.getTags(path, f)
-      # sort and insert
+      if not keep:
+         self.sum_var.set("Loading...")
+         # old content is not valid any more
+         self.rows, self.inserted, self.position = [], 0, None
+         self.selected = ()
+         self.select_all = False
+         self.list.delete(*self.list.get_children())
+         self.root.watcher.watch(self.index, path)
+         self.changes = []
+      # read in background, see showFiles
+      self.loading += 1
+      self.waiting += 1
+      threading.Thread(target=self.readFiles, daemon=True,
+                       args=(path, self.loading, focus, done, keep)).start()
+      if self.waiting == 1:
+         self.after(5, self.checkLoaded)
+
+   def readFiles(self, path, n, focus, done, keep):
+      "Get folder content, executed in separate thread"
+      try:
+         mtime = os.stat(path).st_mtime_ns
+         parts = readParts(path)
+         dirs, files = next(parts)
+         if len(dirs) + len(files) == CHUNK and not keep:
+            # the first screen is shown at once, the rest is merged later
+            self.loaded.put((n, path, (list(dirs), list(files)), None, None, None))
+            keep = True
+         for d, f in parts:
+            dirs += d
+            files += f
+      except OSError as e:
+         res = e
+      else:
+         # tags from read-only connection, the window is not blocked
+         res = (mtime, dirs, files, self.fo.readDirTags(path))
+      self.loaded.put((n, path, res, focus, done, keep))
+
+   def checkLoaded(self):
+      "Show the folder when it is read"
+      while not self.loaded.empty():
+         n, path, res, focus, done, keep = self.loaded.get()
+         if keep is None:
+            if n == self.loading: self.showPart(*res)
+            continue
+         self.waiting -= 1
+         if n == self.loading:   # skip old requests
+            self.showFiles(path, res, focus, done, keep)
+      if self.waiting > 0:
+         self.after(5, self.checkLoaded)
+
+   def showPart(self, dirs, files):
+      "Show the first elements of the folder while the rest is read"
+      self.path_dir, self.path_file, self.path_tags = dirs, files, {}
       self.sort(NAME, False)
+      if self.isactive:
+         self.makeActive()
+
+   def showFiles(self, path, res, focus, done, keep=False):
+      "Insert files of the current path"
+      if isinstance(res, OSError):
+         self.sum_var.set(str(res))
+         return
+      self.mtime, self.path_dir, self.path_file, self.path_tags = res
+      # untagged files are not included
+      if self.path_tags is None: self.path_tags = self.fo.getDirTags(path)
+      # sort and insert
+      if keep:
+         self.arrange()
+      else:
+         self.sort(NAME, False)
       if focus:
-         n = self.path_dir.index(focus) 
-         self.position = self.list.get_children()[n+1]
+         self.showItem(focus)
+         if self.list.exists(focus): self.position = focus
+      if self.changes:
+         self.applyChanges([])
       if self.isactive:
          self.makeActive()
+      if done: done()
 
    def filesize(self, x):
       "Pretty print for file size"
@@ -143,24 +272,20 @@ class FileList(Frame):
       self.writeFiles(path,directory)
 
    def makeActiveExt(self, ev):
-      "Check for changes and make active"
-      tmp = 0
-      for p in os.listdir(self.getPath()):
-         if p.startswith('.'): continue
-         tmp += hash(p)
-      # update if need
-      if tmp != self.hash:
-         self.refresh()
+      "Apply changes and make active"
+      self.root.updatePanels()
       self.makeActive()
 
-
    def makeActive(self):
       "Set focus and cursor"
       self.isactive = True
       self.root.src = self.index
-      iid = self.position if self.position else self.list.get_children()[0]
-      # set selection
-      self.list.selection_set(iid)
+      iid = self.position if self.position else PREVIOUS_DIR
+      if not self.list.exists(iid): return   # not loaded yet
+      # restore selection
+      selected = [nm for nm in self.selected if self.list.exists(nm)]
+      self.list.selection_set(selected if len(selected) > 1 else iid)
+      self.selected = ()
       self.list.focus_set()
       self.list.focus(iid)
 
@@ -168,7 +293,8 @@ class FileList(Frame):
       "Clear cursor"
       self.isactive = False
       self.position = self.list.focus()
-      # clear selection
+      # menu commands use the saved selection, only the view is cleared
+      self.selected = self.list.selection()
       self.list.selection_remove(self.list.get_children())
 
    def currentItem(self):
@@ -180,25 +306,27 @@ class FileList(Frame):
 
    def rename(self, ev):
       "Change name of a file (directory)"
-      if self.fo.rename(self.getFocus()):
-         self.refresh()
+      new_name = self.fo.rename(self.getFocus())
+      if new_name:
+         self.refresh(lambda: self.selectName(os.path.split(new_name)[1]))
          self.list.focus_set()
 
    def remove(self, ev):
-      "Remove file (directory)"
+      "Remove selected files (directories)"
+      lst = self.getSelected()
+      if not lst: return
       focus = self.list.focus()
       items = self.list.get_children()
       ind = items.index(focus)
-      if self.fo.remove(self.getFocus()):
-         self.refresh()
-         self.position = self.list.get_children()[ind-1]
-         self.makeActive()
+      if self.fo.remove(lst):
+         self.refresh(lambda: self.selectIndex(ind-len(lst)))
 
    def newDir(self, ev):
       "Create new directory"
-      if self.fo.newDir(self.getPath()):
+      new_dir = self.fo.newDir(self.getPath())
+      if new_dir:
          self.list.focus_set()
-         self.refresh()
+         self.refresh(lambda: self.selectName(os.path.split(new_dir)[1]))
 
    def getPath(self):
       "Get current folder path"
@@ -213,9 +341,75 @@ class FileList(Frame):
       "Get full path to the file under cursor"
       return os.path.join(self.dir_var.get(), self.getName())
 
-   def refresh(self):
-      "Refresh panel state"
-      self.writeFiles(self.dir_var.get())
+   def allSelected(self):
+      "All the elements are selected, including rows which are not inserted yet"
+      if not self.select_all: return False
+      lst = self.list.selection() if self.isactive else self.selected
+      return len(lst) == self.inserted
+
+   def selectedNames(self):
+      "Names of selected elements, or element under cursor"
+      if self.allSelected(): return [r[0] for r in self.rows]
+      lst = self.list.selection() if self.isactive else self.selected
+      if not lst:
+         lst = [self.list.focus() if self.isactive else self.position]
+      return [iid for iid in lst if iid and iid != PREVIOUS_DIR and self.list.exists(iid)]
+
+   def getSelected(self):
+      "Get list of full paths for selected elements"
+      path = self.dir_var.get()
+      return [os.path.join(path, nm) for nm in self.selectedNames()]
+
+   def selectedFiles(self):
+      "Selected names without folders"
+      if self.allSelected(): return [f.name for f in self.path_file]
+      return [nm for nm in self.selectedNames() if 'file' in self.list.item(nm, 'tags')]
+
+   def toggleSelect(self, ev):
+      "Add/remove element under cursor, go to the next one"
+      iid = self.list.focus()
+      if not iid: return
+      self.list.selection_toggle(iid)
+      nxt = self.list.next(iid)
+      if nxt:
+         self.list.focus(nxt)
+         self.list.see(nxt)
+      return 'break'
+
+   def selectAll(self, ev):
+      "Select all elements of the folder, the rest is selected when inserted"
+      self.list.selection_set([iid for iid in self.list.get_children() if iid != PREVIOUS_DIR])
+      self.select_all = True
+      return 'break'
+
+   def selectIndex(self, ind):
+      "Put cursor to the row with given number"
+      self.showItem(max(ind, 0))
+      items = self.list.get_children()
+      self.position = items[min(max(ind, 0), len(items)-1)]
+      self.makeActive()
+
+   def selectName(self, name):
+      "Put cursor to the row with given name"
+      self.showItem(name)
+      if not self.list.exists(name): return
+      self.position = name
+      self.list.see(name)
+      if self.isactive: self.makeActive()
+
+   def refresh(self, done=None):
+      "Refresh panel state if folder was changed"
+      path = self.dir_var.get()
+      try:
+         mtime = os.stat(path).st_mtime_ns
+      except OSError:
+         # go to existing folder
+         while not os.path.isdir(path): path = os.path.split(path)[0]
+         return self.writeFiles(path, done=done)
+      if mtime != self.mtime:
+         self.writeFiles(path, done=done, keep=True)
+      elif done:
+         done()
 
    def openFile(self, ev):
       "Execute file under cursor"
@@ -223,49 +417,199 @@ class FileList(Frame):
 
    def sort(self, col, rev=True):
       "Sort file list according the parameter"
-      path = self.dir_var.get()
       if col==NAME:
-         self.path_dir.sort(reverse=self.reverse)
-         self.path_file.sort(reverse=self.reverse)
+         self.dir_order = self.file_order = (lambda x: x.name, self.reverse)
       elif col==SIZE:
-         self.path_file.sort(key=lambda x: os.path.getsize(os.path.join(path, x)),
-                             reverse=self.reverse)
+         self.file_order = (lambda x: x.size, self.reverse)
       elif col==TYPE:
-         self.path_file.sort(key=lambda x: x.rsplit('.',1)[1] if '.' in x else '',
-                             reverse=self.reverse)
+         self.file_order = (lambda x: x.ext, self.reverse)
       elif col==DATE:
-         self.path_dir.sort(key=lambda x: os.path.getmtime(os.path.join(path,x)),
-                            reverse=self.reverse)
-         self.path_file.sort(key=lambda x: os.path.getmtime(os.path.join(path,x)),
-                             reverse=self.reverse)
+         self.dir_order = self.file_order = (lambda x: x.mtime, self.reverse)
       else:
          return
       # change reversion if need
       if rev: self.reverse = not self.reverse
-      # clear and start a new list
-      self.list.delete(*self.list.get_children())
-      self.position = self.list.insert("", 0, text=PREVIOUS_DIR, tags='dir')
-      # folders
-      for d in self.path_dir:
-         tm = os.path.getmtime(os.path.join(path,d))
-         self.list.insert("", "end", text=d, image=self.folder_img, values=
-                   ("","<DIR>",time.strftime("%d.%m.%Y", time.gmtime(tm))), tags='dir')
-      # files
-      f_sum = 0
-      for f in self.path_file:
-         stat = os.stat(os.path.join(path,f))
-         tm = stat.st_mtime
-         sz = stat.st_size
-         f_sum += sz
-         nm, tp = os.path.splitext(f)
-         ftags = 'file' if self.path_tags[f] else ('file','empty')
-         self.list.insert("", "end", text=nm, tags=ftags, image=self.file_img, values=
-                           (tp, self.filesize(sz), time.strftime("%d.%m.%Y", time.gmtime(tm))))
-      self.sum_var.set("Folders: %d  Files: %d  Size: %s" % (
-                          len(self.path_dir), len(self.path_file), self.filesize(f_sum)))
+      self.arrange()
+
+   def arrange(self):
+      "Sort elements with the current order and show them"
+      self.path_dir.sort(key=self.dir_order[0], reverse=self.dir_order[1])
+      self.path_file.sort(key=self.file_order[0], reverse=self.file_order[1])
+      # prepare rows, use names as id-s
+      self.syncRows([self.rowOf(x) for x in self.path_dir + self.path_file])
+      self.showSummary()
+
+   def syncRows(self, rows):
+      "Show the new rows, change only the difference with the current list"
+      old = dict(self.rows[:self.inserted])   # shown rows
+      new = set(r[0] for r in rows)
+      gone = [iid for iid in old if iid not in new]
+      if gone:
+         # keep cursor near its place
+         for attr in ('position', 'focus'):
+            iid = self.list.focus() if attr == 'focus' else self.position
+            if iid not in gone: continue
+            near = self.list.next(iid)
+            while near and near in gone: near = self.list.next(near)
+            if attr == 'focus':
+               self.list.focus(near or PREVIOUS_DIR)
+            else:
+               self.position = near or None
+         self.list.delete(*gone)
+      if not self.list.exists(PREVIOUS_DIR):
+         self.list.insert("", 0, PREVIOUS_DIR, text=PREVIOUS_DIR, tags='dir')
+      # rows under cursor and selected rows stay in the list, the others are added later
+      marked = set(self.list.selection()) | set(self.selected) | {self.list.focus(), self.position}
+      stop = max((i + 1 for i, r in enumerate(rows) if r[0] in old and r[0] in marked), default=0)
+      stop = max(stop, min(CHUNK, len(rows)))
+      later = [r[0] for r in rows[stop:] if r[0] in old]
+      if later:
+         self.list.delete(*later)
+      for iid, kw in rows[:stop]:
+         if iid not in old:
+            self.list.insert("", "end", iid, **kw)
+         elif old[iid] != kw:
+            self.list.item(iid, **kw)
+      # reorder without deletion
+      self.list.set_children("", PREVIOUS_DIR, *(r[0] for r in rows[:stop]))
+      self.rows, self.inserted = rows, stop
+      # add the rest later
+      self.insertRows(rows)
+
+   def rowOf(self, info):
+      "Get (id, properties) of the list row"
+      tm = time.strftime("%d.%m.%Y", time.gmtime(info.mtime))
+      if info.is_dir:
+         return (info.name, dict(text=info.name, image=self.folder_img, tags='dir',
+                                 values=("", "<DIR>", tm)))
+      nm = info.name[:len(info.name)-len(info.ext)]
+      ftags = 'file' if info.name in self.path_tags else ('file','empty')
+      return (info.name, dict(text=nm, image=self.file_img, tags=ftags,
+                              values=(info.ext, self.filesize(info.size), tm)))
+
+   def showSummary(self):
+      "Show number of elements and size"
+      if self.status: return self.sum_var.set(self.status)
+      self.sum_var.set("Folders: %d  Files: %d  Size: %s" % (len(self.path_dir),
+                       len(self.path_file), self.filesize(sum(f.size for f in self.path_file))))
+
+   def showTransfers(self, jobs):
+      "Show progress of copy/move instead of summary"
+      status = []
+      for job in jobs:
+         percent, speed = job.progress()
+         status.append("%s %s: %d%%  %s/s" % ("Move" if job.move else "Copy",
+                       os.path.split(job.src)[1], percent, self.filesize(speed)))
+      status = "   ".join(status)
+      if status or self.status:
+         self.status = status
+         self.showSummary()
+
+   def applyChanges(self, changes):
+      "Update rows according to the file system events"
+      self.changes.extend(changes)
+      if self.waiting: return   # apply after reading
+      changes, self.changes = self.changes, []
+      path = self.getPath()
+      for kind, name in changes:
+         if kind == RELOAD:
+            # go to existing folder
+            while not os.path.isdir(path): path = os.path.split(path)[0]
+            return self.writeFiles(path)
+         if name.startswith('.'): continue
+         info = pathInfo(path, name) if kind == ADD else None
+         i = self.rowIndex(name)
+         if info and i != -1 and (i < len(self.path_dir)) == info.is_dir:
+            self.updateRow(info, i)
+         else:
+            self.dropRow(name)
+            if info: self.putRow(info)
+      try:
+         self.mtime = os.stat(path).st_mtime_ns
+      except OSError:
+         pass
+      self.showSummary()
+
+   def putRow(self, info):
+      "Insert new row according to the current sorting"
+      if info.is_dir:
+         lst, (key, rev), start = self.path_dir, self.dir_order, 0
+      else:
+         lst, (key, rev), start = self.path_file, self.file_order, len(self.path_dir)
+         tags = self.fo.getTags(self.getPath(), info.name)
+         if tags: self.path_tags[info.name] = tags
+      k = key(info)
+      n = next((i for i, x in enumerate(lst) if (key(x) < k if rev else key(x) > k)), len(lst))
+      lst.insert(n, info)
+      row = self.rowOf(info)
+      self.rows.insert(start + n, row)
+      # the list is already filled up to this row
+      if start + n < self.inserted or self.inserted == len(self.rows) - 1:
+         self.list.insert("", start + n + 1, row[0], **row[1])
+         self.inserted += 1
+
+   def rowIndex(self, name):
+      "Position of the row in model, -1 if not found"
+      return next((i for i, r in enumerate(self.rows) if r[0] == name), -1)
+
+   def updateRow(self, info, i):
+      "Change properties of existing row with index i"
+      if info.is_dir:
+         self.path_dir[i] = info
+      else:
+         self.path_file[i - len(self.path_dir)] = info
+      row = self.rowOf(info)
+      self.rows[i] = row
+      if self.list.exists(row[0]):
+         self.list.item(row[0], **row[1])
+
+   def dropRow(self, name):
+      "Remove row with given name"
+      i = self.rowIndex(name)
+      if i == -1: return
+      del self.rows[i]
+      if i < len(self.path_dir):
+         del self.path_dir[i]
+      else:
+         del self.path_file[i - len(self.path_dir)]
+      self.path_tags.pop(name, None)
+      if not self.list.exists(name): return
+      # move cursor
+      if name in (self.position, self.list.focus()):
+         near = self.list.next(name) or self.list.prev(name)
+         self.position = near
+         if self.isactive:
+            self.list.selection_set(near)
+            self.list.focus(near)
+      self.list.delete(name)
+      self.inserted -= 1
+
+   def insertRows(self, rows, num=CHUNK):
+      "Insert next group of rows into the list"
+      if rows is not self.rows: return   # list was changed
+      start, stop = self.inserted, min(self.inserted + num, len(rows))
+      for iid, kw in rows[start:stop]:
+         self.list.insert("", "end", iid, **kw)
+      if self.allSelected():
+         new = [r[0] for r in rows[start:stop]]
+         if self.isactive:
+            self.list.selection_add(new)
+         else:
+            self.selected += tuple(new)
+      self.inserted = stop
+      if stop < len(rows):
+         self.after(1, self.insertRows, rows)
+
+   def showItem(self, iid):
+      "Insert all rows up to the given one (name or index)"
+      stop = iid if isinstance(iid, int) else self.rowIndex(iid)
+      if stop >= self.inserted:
+         self.insertRows(self.rows, stop - self.inserted + 1)
 
    def tagEdit(self, ev):
       "Open entry for tag edition"
+      self.marked = self.selectedFiles()
+      if not self.marked: return
       self.position = self.list.focus()
       self.taglist['state']='normal'
       self.taglist.focus_set()
@@ -274,59 +618,62 @@ class FileList(Frame):
    def tagApply(self, ev):
       "Apply tag modification"
       tag_str = self.tag_var.get()
-      tag_lst = [s.strip() for s in tag_str.split(',')]
-      if tag_lst:
-         # save to database
-         self.fo.setTags(self.getPath(), self.getName(), tag_lst)
+      tag_lst = [s.strip() for s in tag_str.split(',') if s.strip()]
+      # change only the common tags of the selected files
+      common = self.commonTags(self.marked)
+      items = {}
+      for nm in self.marked:
+         old = self.path_tags.get(nm, [])
+         items[nm] = ([t for t in old if t not in common or t in tag_lst] +
+                      [t for t in tag_lst if t not in old])
+      # save to database
+      self.fo.setTags(self.getPath(), items)
       self.taglist['state']='readonly'
-      # add to current dictionary
-      self.path_tags[self.getName()] = tag_lst 
-      # update background
-      self.list.item(self.position, tags = 'file' if tag_lst else ('file','empty'))
+      for nm, tags in items.items():
+         # update current dictionary
+         if tags:
+            self.path_tags[nm] = tags
+         else:
+            self.path_tags.pop(nm, None)
+         # update background
+         if self.list.exists(nm):
+            self.list.item(nm, tags = 'file' if tags else ('file','empty'))
       self.makeActive()
 
    def tagExit(self, ev):
       "Exit without saving"
       # return last state
-      self.tag_var.set(self.path_tags[self.getName()])
+      self.tag_var.set(', '.join(self.commonTags(self.marked)))
       # exit
       self.taglist['state']='readonly'
       self.makeActive()
 
    def showTags(self, ev):
-      "Show tags for current file"
-      fname = self.getName()
-      self.tag_var.set(', '.join(self.path_tags[fname]))
+      "Show tags for current file, common tags for the selected files"
+      self.tag_var.set(', '.join(self.commonTags(self.selectedFiles())))
+
+   def commonTags(self, names):
+      "Tags which all the files have"
+      if not names: return []
+      rest = [set(self.path_tags.get(nm, [])) for nm in names[1:]]
+      return [t for t in self.path_tags.get(names[0], []) if all(t in r for r in rest)]
 
    def wordComplete(self, ev):
       "Complete tag by Ctrl+Right"
-      # get last tag
-      tag_str = self.tag_var.get()
-      tag_lst = [s.strip() for s in tag_str.split(',')]
-      start = tag_lst[-1]
-      if start == "": return
-      if start.startswith(self.last_tag) and len(self.last_tag_lst) > 0:
-         # not first key press for current word
-         self.last_tag_num = (self.last_tag_num + 1) % len(self.last_tag_lst)
-      else:
-         # first key press
-         self.last_tag_lst = self.fo.tagsStartsWith(start)  # find similar tags
-         if len(self.last_tag_lst) == 0: return
-         self.last_tag, self.last_tag_num = start, 0
-      # change string
-      tag_lst[-1] = self.last_tag_lst[self.last_tag_num]
-      self.tag_var.set(', '.join(tag_lst))
-      
+      text = self.completer.next(self.tag_var.get())
+      if text is not None: self.tag_var.set(text)
+
    def quickSearch(self, ev):
       "Press letters for quick search"
       v = ev.char
       if not(v.isalnum() or v in (' ','_','-')):
          return
       self.buf += v
-      # search
-      for i, v in enumerate(self.list.get_children()):
-         if self.list.item(v)['text'].startswith(self.buf):
-            self.list.see(v)
+      # search in all rows, insert the found one
+      for i, (iid, kw) in enumerate(self.rows):
+         if kw['text'].startswith(self.buf):
+            self.showItem(i)
+            self.list.see(iid)
             break
             
    def bufReset(self):
@@ -3,29 +3,36 @@ Operation with files and interface for database
 """
 
 import os
-import shutil
+import shlex
+import sqlite3
 import subprocess
 import tkinter.simpledialog as dlg
 import tkinter.messagebox as msg
 
-from .tagbase import TagBase
-from tmconfig import programs, delete
-
-DB_NAME = './manager/db/tags.db'
+from .core import openBase
+from .progress import ProgressWindow
+from .stream import SearchStream
+from .transfer import TransferQueue, Job
+from .launcher import Launcher, TooMany
+from .trash import Trash
+from .vocabulary import Vocabulary
+from tmconfig import programs, reuse, max_programs, delete, transfer_workers
+from tmconfig import profile_queries, slow_query
 
 class FileOperation:
    "Execute file operations and contain database inside"
 
    def __init__(self):
-      self.db = TagBase(DB_NAME)
-      # get program list
-      self.run_cmd = {}
-      for k in programs:
-        for elt in programs[k]:
-          self.run_cmd[elt] = k
+      self.vocab = Vocabulary()   # tag names, updated by base
+      self.db = openBase(None, self.vocab)
+      if profile_queries: self.db.profile(True, slow_query)
+      self.transfers = TransferQueue(transfer_workers)
+      # programs for file types
+      self.launcher = Launcher(programs, reuse, max_programs)
+      self.trash = Trash()
 
    def rename(self, old_name):
-      "Rename file (directory)"
+      "Rename file (directory), get the new name"
       path = os.path.split(old_name)
       nm, tp = os.path.splitext(path[1])
       # don't change file type
@@ -41,85 +48,105 @@ class FileOperation:
             self.db.changeFileName(new_name, *path)
          # rename
          os.rename(old_name, full_name)
-         return True
+         return full_name
       else:
          return False
 
-   def remove(self, fname):
-      "Remove file (directory)"
-      path = os.path.split(fname)
-      if msg.askyesno("Remove ?", path[1]):
-         # update tags
-         if os.path.isdir(fname):
-            self.db.delFolder(fname)
-         else:
-            self.db.delFile(*path)
-         # remove (to trash)
-         subprocess.call([delete, fname])
-         return True
+   def remove(self, fnames):
+      "Remove list of files (directories)"
+      if not msg.askyesno("Remove ?", title(fnames)): return False
+      removed, errors = [], []
+      # the path is not available after removal
+      is_dir = {f: os.path.isdir(f) and not os.path.islink(f) for f in fnames}
+      if delete:
+         # external program, e.g. 'gio trash'
+         try:
+            code = subprocess.call(shlex.split(delete) + fnames)
+            if code == 0:
+               removed = fnames
+            else:
+               errors.append("%s: exit code %d" % (delete, code))
+         except OSError as e:
+            errors.append(str(e))
       else:
-         return False
+         for fname in fnames:
+            try:
+               self.trash.put(fname)
+               removed.append(fname)
+            except OSError as e:
+               errors.append(str(e))
+      # update tags for the removed elements
+      with self.db.transaction():
+         for fname in removed:
+            if is_dir[fname]:
+               self.db.delFolder(fname)
+            else:
+               self.db.delFile(*os.path.split(fname))
+      if errors: msg.showerror("Remove", "\n".join(errors[:10]))
+      return True
 
    def newDir(self, path):
-      "Add new folder"
+      "Add new folder, get its full name"
       name = dlg.askstring("New folder", "Enter name")
       if name:
          full_name = os.path.join(path, name)
          # check
          if self.isExistDir(full_name): return
          os.mkdir(full_name)
-         return True
+         return full_name
       else:
          return False
 
-   def copy(self, src, dst):
-      "Copy file (directory)"
-      path = os.path.split(src)
-      name = path[1]
-      if msg.askyesno("Copy", name) and os.path.isdir(dst):
-         full_name = os.path.join(dst, name)
-         if os.path.isdir(src):
-            # check existance
-            if self.isExistDir(full_name): return
-            self.db.addDirCopy(full_name, src)
-            shutil.copytree(src, full_name)
-         else:
-            # check existance
-            if self.isExistFile(full_name): return
-            # update database
-            self.db.addFileCopy(dst, *path)
-            # copy
-            shutil.copyfile(src, full_name)
-         return True
-      else:
-         return False
-
-   def move(self, src, dst):
-      "Move file (directory)"
-      path = os.path.split(src)
-      name = path[1]
-      if msg.askyesno("Move", name) and os.path.isdir(dst):
-         full_path = os.path.join(dst, name)
-         # check existance
-         if (os.path.isfile(src) and self.isExistFile(full_path) or
-             os.path.isdir(src) and self.isExistDir(full_path)): return
-         # update database
-         if os.path.isfile(src):
-            self.db.changeFilePath(dst, *path)
-         else:
-            self.db.changeDirPath(full_path, src)
-         # move
-         shutil.move(src, full_path)
-         return True
-      else:
-         return False
+   def copy(self, srcs, dst):
+      "Copy files (directories) in background, return list of jobs"
+      return self.transfer(srcs, dst, False)
+
+   def move(self, srcs, dst):
+      "Move files (directories) in background, return list of jobs"
+      return self.transfer(srcs, dst, True)
+
+   def transfer(self, srcs, dst, move):
+      "Make copy/move jobs"
+      if not (msg.askyesno("Move" if move else "Copy", title(srcs)) and os.path.isdir(dst)):
+         return []
+      pairs = [(src, os.path.join(dst, os.path.split(src)[1])) for src in srcs]
+      # check existance
+      exist = [p[1] for p in pairs if os.path.exists(p[1])]
+      if exist:
+         msg.showerror("Already exist", title(exist))
+         pairs = [p for p in pairs if p[1] not in exist]
+      # database is updated when the files are copied
+      return [self.transfers.submit(Job(src, full_name, move)) for src, full_name in pairs]
+
+   def checkTransfers(self):
+      "Save landed files into database, return list of finished jobs"
+      done = self.transfers.finished()
+      for job in self.transfers.jobs + done:
+         # complete folder copy is saved with one set-based copy
+         tree = not job.move and os.path.isdir(job.src) and not os.path.islink(job.src)
+         if tree and not job.finished: continue
+         lst = job.take()
+         if not lst: continue
+         with self.db.transaction():
+            if job.move:
+               for is_dir, src, dst in lst:
+                  if is_dir:
+                     self.db.changeDirPath(dst, src)
+                  else:
+                     self.db.changeFilePath(os.path.dirname(dst), *os.path.split(src))
+            elif tree and not (job.error or job.cancelled):
+               self.db.addDirCopy(job.dst, job.src)
+            else:
+               self.db.addFilesCopy([(os.path.dirname(dst),) + os.path.split(src)
+                                     for is_dir, src, dst in lst])
+      return done
 
    def execute(self, fname):
-      "Execute current file"
-      nm, tp = os.path.splitext(os.path.split(fname)[1])
-      if tp: tp = tp[1:].lower()  # remove '.', correct size
-      if tp in self.run_cmd.keys():
-         return subprocess.call([self.run_cmd[tp], fname])
+      "Open current file, don't wait for the program"
+      try:
+         return self.launcher.open(fname)
+      except (OSError, TooMany) as e:
+         msg.showerror("Open", str(e))
 
    def isExistFile(self, path):
       "Check file existance, show error"
@@ -139,9 +166,27 @@ class FileOperation:
       "Get tag list for current file"
       return self.db.getFileTags(path, name)
 
-   def setTags(self, path, name, tags):
-      "Update file tags"
-      self.db.updateFileTags(path, name, tags)
+   def getDirTags(self, path):
+      "Get tags for all files in directory"
+      return self.db.getDirTags(path)
+
+   def readDirTags(self, path):
+      "Get tags for directory in other thread, None if it is not possible"
+      try:
+         with self.db.reading() as base:
+            return base.getDirTags(path)
+      except sqlite3.Error:
+         return None
+
+   def setTags(self, path, items):
+      "Update tags, items is dictionary {file name: tags}"
+      with self.db.transaction():
+         for name, tags in items.items():
+            self.db.updateFileTags(path, name, tags)
+
+   def profile(self, on):
+      "Start or stop measurement of queries"
+      self.db.profile(on, slow_query)
 
    def baseInfo(self):
       "String with statistic about database"
@@ -149,20 +194,22 @@ class FileOperation:
 
    def tagList(self):
       "Get list of all tags"
-      return self.db.tagList()
+      return list(self.vocab)
 
-   def findFiles(self, tags):
-      "Find files with given tags"
-      return self.db.findFiles(tags)
-      
-   def findByName(self, name):
-      "Find files using part of file name"
-      return self.db.findByName(name)
+   def search(self, text, by_name=False):
+      "Start search in background, see SearchStream"
+      if by_name:
+         request = lambda base: base.nameSql(text)
+      else:
+         request = lambda base: base.querySql(text)
+      # statistics of the main base include the search
+      return SearchStream(self.db.db_path, request, profiler=self.db.profiler)
 
-   def correctDb(self):
+   def correctDb(self, master, incremental=False):
       "Remove from database files wich are no more exist"
-      self.db.correct()
-      msg.showinfo("DB correction", "Done")
+      steps = self.db.correct(incremental)
+      if ProgressWindow(master, "DB correction", steps, "Folders: %d / %d").run():
+         msg.showinfo("DB correction", "Done")
 
    def tagRename(self, new_name, old_name):
       "Change tag name"
@@ -173,9 +220,15 @@ class FileOperation:
       self.db.delTag(tname)
 
    def tagsStartsWith(self, start):
-      "Get list of tags starts with given word"
-      return self.db.tagsStartsWith(start)
+      "Get list of tags for the word, frequent first"
+      return self.vocab.complete(start)
 
    def getRandomFile(self):
       "Get random element from the database"
       return self.db.getRandom()
+
+def title(fnames):
+   "Name of the file or number of elements"
+   if len(fnames) == 1:
+      return os.path.split(fnames[0])[1]
+   return "%d elements" % len(fnames)
@@ -0,0 +1,60 @@
+"""
+Start external programs without waiting for them
+"""
+
+import os
+import mimetypes
+import subprocess
+
+class TooMany(Exception):
+   "Limit of running programs is reached"
+   pass
+
+class Launcher:
+   "Open files with programs from the configuration, keep track of them"
+
+   def __init__(self, programs, reuse=None, limit=8):
+      self.ext = {}      # extension : program
+      self.mime = {}     # 'type/subtype' or 'type/*' : program
+      for prog, keys in programs.items():
+         for k in keys:
+            k = k.lower()
+            if '/' in k:
+               self.mime[k] = prog
+            else:
+               self.ext[k.lstrip('.')] = prog
+      self.reuse = reuse or {}   # program : arguments to open file in running copy
+      self.limit = limit
+      self.running = {}   # (program, file) : process
+
+   def program(self, fname):
+      "Get program for the file or None"
+      prog = self.ext.get(os.path.splitext(fname)[1][1:].lower())
+      if prog or not self.mime: return prog
+      tp = mimetypes.guess_type(fname)[0]
+      if tp is None: return None
+      return self.mime.get(tp) or self.mime.get(tp.split('/')[0] + '/*')
+
+   def open(self, fname):
+      "Run program for the file, get the process or None if the type is unknown"
+      prog = self.program(fname)
+      if prog is None: return None
+      self.reap()
+      key = (prog, os.path.abspath(fname))
+      proc = self.running.get(key)
+      if proc: return proc   # already shown
+      cmd = [prog, fname]
+      if prog in self.reuse and any(p == prog for p, f in self.running):
+         cmd = [prog] + self.reuse[prog] + [fname]
+      if len(self.running) >= self.limit:
+         raise TooMany("%d programs are running" % len(self.running))
+      proc = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                              stderr=subprocess.DEVNULL, start_new_session=True)
+      self.running[key] = proc
+      return proc
+
+   def reap(self):
+      "Forget finished processes"
+      for key, proc in list(self.running.items()):
+         if proc.poll() is not None:
+            del self.running[key]
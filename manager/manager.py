@@ -2,12 +2,18 @@
 Main window of file manager
 """
 
-from tkinter import Frame, Menubutton, Menu, Image
+import os
+from tkinter import Frame, Menubutton, Menu, Image, Toplevel, Text, Scrollbar, BooleanVar
 import tkinter.messagebox as msg
 
-from .filelist import FileList, PREVIOUS_DIR
+from .filelist import FileList
 from .fileoperation import FileOperation
 from .searchwindow import SearchWindow
+from .watcher import DirWatcher
+from .tracer import Tracer
+from tmconfig import trace_ui, ui_stall
+
+WATCH_PERIOD = 300   # ms, check for changes in folders
 
 ABOUT = \
 "TagManager - double panel manager with file tags\n\n\
@@ -19,12 +25,18 @@ Lelt, Right - change directory\n\
 = - make panels equal\n\
 [ - tag edit\n\
 Ctrl+Right - word complete\n\
+Esc - cancel copy/move\n\
+Insert, Ctrl+A - select files\n\
 / - open search window\n\
 \nSearch window: \n\
 Ctrl+S - search \n\
 Ctrl+R - reset\n\
 Ctrl+O - open directory with file\n\
-? word - find files with this word"
+Esc - stop search, close window\n\
+? word - find files with this word\n\
+a, b  a OR b  NOT a  (a)  - tag query\n\
+tag*  in:path  ext:pdf  name:word - filters\n\
+\"r&b\"  \"NOT\" - quoted tag"
 
 
 class TagManager:
@@ -32,11 +44,15 @@ class TagManager:
 
    def __init__(self, root, ver):
       self.root = root
+      # measure handlers, must be started before binding
+      self.tracer = Tracer(root, ui_stall).start() if trace_ui else None
       # resize
       self.root.rowconfigure(1, weight=1)
       self.root.columnconfigure(0, weight=1)
       self.root.columnconfigure(1, weight=1)
       self.fo = FileOperation()
+      self.profile_var = BooleanVar(value=self.fo.db.profiler is not None)
+      self.watcher = DirWatcher()
       # widgets
       self.panel = (FileList(self, self.fo, 0),
                     FileList(self, self.fo, 1))
@@ -59,31 +75,65 @@ class TagManager:
       img = Image("photo", file="./manager/img/tm.gif")
       self.root.call('wm', 'iconphoto', self.root._w, img)
       self.root.title('TagManager v.' + ver)
+      self.root.after(WATCH_PERIOD, self.watchLoop)
       # evaluate
       self.root.mainloop()
+      # stop copying, save what is done
+      self.fo.transfers.close()
+      self.fo.checkTransfers()
+      if self.tracer:
+         self.tracer.stop()
+         self.tracer.export(trace_ui)
 
    def copy(self, ev):
       "Copy file (directory)"
       # get path
       src, dst = self.src, 1-self.src
-      src_path = self.panel[src].getFocus()
-      if src_path.endswith(PREVIOUS_DIR): return
+      src_lst = self.panel[src].getSelected()
+      if not src_lst: return
       dst_path = self.panel[dst].getPath()
       # copy
-      if self.fo.copy(src_path, dst_path):
-         self.panel[dst].refresh()
+      if self.fo.copy(src_lst, dst_path):
+         self.updateTransfers()
 
    def move(self, ev):
       "Move file (directory)"
       # get path
       src, dst = self.src, 1-self.src
-      src_path = self.panel[src].getFocus()
-      if src_path.endswith(PREVIOUS_DIR): return
+      src_lst = self.panel[src].getSelected()
+      if not src_lst: return
       dst_path = self.panel[dst].getPath()
       # move
-      if self.fo.move(src_path, dst_path):
-         self.panel[src].refresh()
-         self.panel[dst].refresh()
+      if self.fo.move(src_lst, dst_path):
+         self.updateTransfers()
+
+   def updatePanels(self):
+      "Apply changes in file system to panels"
+      changes = self.watcher.changes()
+      for p in self.panel:
+         lst = changes.get(p.getPath())
+         if lst: p.applyChanges(lst)
+
+   def updateTransfers(self):
+      "Save results of copy/move, show progress in panels"
+      done = self.fo.checkTransfers()
+      for job in done:
+         if job.error: msg.showerror("Move" if job.move else "Copy", str(job.error))
+      if done:
+         for p in self.panel: p.refresh()
+      jobs = self.fo.transfers.jobs
+      for p in self.panel:
+         path = p.getPath()
+         p.showTransfers([j for j in jobs if path in (os.path.dirname(j.src),
+                                                       os.path.dirname(j.dst))])
+
+   def watchLoop(self):
+      "Check changes periodically"
+      self.updatePanels()
+      self.updateTransfers()
+      self.fo.launcher.reap()
+      self.fo.db.sync()   # changes of other programs
+      self.root.after(WATCH_PERIOD, self.watchLoop)
 
    def makeEqual(self, ev):
       "Make filelist in dst equal to src"
@@ -98,9 +148,29 @@ class TagManager:
       menu.add_command(label='Search... (/)', command=lambda: self.openSearch(1))
       menu.add_command(label='Edit ([)', command=lambda: self.panel[self.src].tagEdit(1))
       menu.add_command(label="Don't save (Esc)", command=lambda: self.panel[self.src].tagExit(1))
-      menu.add_command(label='Correct DB', command=lambda: self.fo.correctDb())
+      menu.add_command(label='Correct DB', command=lambda: self.fo.correctDb(self.root))
+      menu.add_command(label='Correct changed folders',
+                       command=lambda: self.fo.correctDb(self.root, True))
+      menu.add_separator({})
+      menu.add_checkbutton(label='Profile queries', variable=self.profile_var,
+                           command=lambda: self.fo.profile(self.profile_var.get()))
+      menu.add_command(label='Query statistics',
+                       command=lambda: self.showText('Query statistics', self.fo.db.profileReport()))
       fbutton.configure(menu=menu)
 
+   def showText(self, title, report):
+      "Window with statistics"
+      slave = Toplevel(self.root)
+      slave.title(title)
+      text = Text(slave, width=100, height=40, wrap='none')
+      scroll = Scrollbar(slave, command=text.yview)
+      text.configure(yscrollcommand=scroll.set)
+      text.insert('1.0', report)
+      text.configure(state='disabled')
+      text.pack(side='left', fill='both', expand=True)
+      scroll.pack(side='right', fill='y')
+      slave.bind('<Escape>', lambda x: slave.destroy())
+
    def menuFile(self):
       "Set menu for file commands"
       cbutton = Menubutton(self.bar, text='Files', underline=0)
@@ -111,6 +181,7 @@ class TagManager:
       menu.add_command(label='Move (F6)', command=lambda: self.move(1))
       menu.add_command(label='New folder (F7)', command=lambda: self.panel[self.src].newDir(1))
       menu.add_command(label='Equal panels (=)', command=lambda: self.makeEqual(1))
+      menu.add_command(label='Cancel copy/move (Esc)', command=self.fo.transfers.cancel)
       menu.add_separator({})
       menu.add_command(label='Quit (Ctrl+Q)', command=lambda: self.root.destroy())
       cbutton.configure(menu=menu)
@@ -122,6 +193,11 @@ class TagManager:
       menu = Menu(hbutton, tearoff=0)
       menu.add_command(label='Keys (F1)', command=lambda: msg.showinfo("Keys", KEYS))
       menu.add_command(label='About', command=lambda: msg.showinfo("About", ABOUT))
+      if self.tracer:
+         menu.add_separator({})
+         menu.add_command(label='Window events',
+                          command=lambda: self.showText('Window events', self.tracer.report()))
+         menu.add_command(label='Save trace', command=lambda: self.tracer.export(trace_ui))
       hbutton.configure(menu=menu)
 
    def openSearch(self, ev):
@@ -0,0 +1,180 @@
+"""
+Versions of the database schema
+
+Each step moves the base from version n-1 to n, the current version
+is kept in PRAGMA user_version. Steps are safe to repeat, because bases
+of early versions could already contain some of the later objects.
+"""
+
+import os
+import sqlite3
+
+def createBase(cursor):
+   "Initial tables"
+   cursor.execute("CREATE TABLE IF NOT EXISTS files (fid INTEGER PRIMARY KEY, "
+                  "f_name TEXT NOT NULL, f_path TEXT NOT NULL,"
+                  "UNIQUE(f_name, f_path))")
+   cursor.execute("CREATE TABLE IF NOT EXISTS tags (tid INTEGER PRIMARY KEY, "
+                  "t_name TEXT NOT NULL UNIQUE)")
+   cursor.execute("CREATE TABLE IF NOT EXISTS filetags (fid INTEGER, tid INTEGER,"
+                  "PRIMARY KEY(fid, tid), "
+                  "FOREIGN KEY(fid) REFERENCES files ON DELETE CASCADE, "
+                  "FOREIGN KEY(tid) REFERENCES tags ON DELETE CASCADE)")
+   if not hasColumn(cursor, 'tags', 't_usage'):
+      # delete tags if they are not more in use
+      cursor.execute("CREATE TRIGGER IF NOT EXISTS tag_del AFTER DELETE ON files "
+                     "BEGIN "
+                     "DELETE FROM tags WHERE tid NOT IN "
+                     "(SELECT DISTINCT tid FROM filetags); "
+                     "END")
+
+def pathIndex(cursor):
+   "Fast search of directory content"
+   cursor.execute("CREATE INDEX IF NOT EXISTS files_path ON files (f_path)")
+
+def nameIndex(cursor):
+   "Full text index for file names, skipped if not supported"
+   cursor.execute("SELECT 1 FROM sqlite_master WHERE name='names'")
+   if cursor.fetchone(): return
+   try:
+      cursor.execute("CREATE VIRTUAL TABLE names USING fts5(f_name, content='files', "
+                     "content_rowid='fid', tokenize='trigram')")
+   except sqlite3.OperationalError:
+      return   # old SQLite version
+   nameTriggers(cursor)
+   # index existing files
+   cursor.execute("INSERT INTO names(names) VALUES ('rebuild')")
+
+def nameTriggers(cursor):
+   "Synchronize name index with files"
+   cursor.execute("CREATE TRIGGER names_ins AFTER INSERT ON files BEGIN "
+                  "INSERT INTO names(rowid, f_name) VALUES (new.fid, new.f_name); "
+                  "END")
+   cursor.execute("CREATE TRIGGER names_del AFTER DELETE ON files BEGIN "
+                  "INSERT INTO names(names, rowid, f_name) VALUES ('delete', old.fid, old.f_name); "
+                  "END")
+   cursor.execute("CREATE TRIGGER names_upd AFTER UPDATE OF f_name ON files BEGIN "
+                  "INSERT INTO names(names, rowid, f_name) VALUES ('delete', old.fid, old.f_name); "
+                  "INSERT INTO names(rowid, f_name) VALUES (new.fid, new.f_name); "
+                  "END")
+
+def tagIndex(cursor):
+   "Files for given tag"
+   cursor.execute("CREATE INDEX IF NOT EXISTS filetags_tag ON filetags (tid, fid)")
+
+def dirState(cursor):
+   "Folder state after the last correction"
+   cursor.execute("CREATE TABLE IF NOT EXISTS dirstate (d_path TEXT PRIMARY KEY, "
+                  "d_mtime INTEGER)")
+
+def tagUsage(cursor):
+   "Count files for each tag instead of trigger which scans all links"
+   if not hasColumn(cursor, 'tags', 't_usage'):
+      cursor.execute("DROP TRIGGER IF EXISTS tag_del")
+      cursor.execute("ALTER TABLE tags ADD COLUMN t_usage INTEGER NOT NULL DEFAULT 0")
+      cursor.execute("UPDATE tags SET t_usage = "
+                     "(SELECT COUNT(*) FROM filetags ft WHERE ft.tid = tags.tid)")
+      cursor.execute("DELETE FROM tags WHERE t_usage = 0")
+   cursor.execute("CREATE TRIGGER IF NOT EXISTS tag_inc AFTER INSERT ON filetags BEGIN "
+                  "UPDATE tags SET t_usage = t_usage + 1 WHERE tid = new.tid; "
+                  "END")
+   cursor.execute("CREATE TRIGGER IF NOT EXISTS tag_dec AFTER DELETE ON filetags BEGIN "
+                  "UPDATE tags SET t_usage = t_usage - 1 WHERE tid = old.tid; "
+                  "END")
+   # find unused tags without scan
+   cursor.execute("CREATE INDEX IF NOT EXISTS tags_unused ON tags (tid) WHERE t_usage <= 0")
+
+def dirTree(cursor):
+   "Store folders in separate table, files refer to them"
+   cursor.execute("CREATE TABLE IF NOT EXISTS dirs (did INTEGER PRIMARY KEY, "
+                  "parent INTEGER REFERENCES dirs ON DELETE CASCADE, name TEXT NOT NULL, "
+                  "UNIQUE(parent, name))")
+   cursor.execute("INSERT OR IGNORE INTO dirs VALUES (0, NULL, '')")   # root
+   if not hasColumn(cursor, 'files', 'f_path'): return
+   # make folders
+   cursor.execute("CREATE TEMP TABLE pathmap (path TEXT PRIMARY KEY, did INTEGER)")
+   cursor.execute("SELECT DISTINCT f_path FROM files")
+   known = {}
+   for (path,) in cursor.fetchall():
+      did = 0
+      for name in path.rstrip(os.sep).split(os.sep):
+         key = (did, name)
+         if key not in known:
+            cursor.execute("INSERT INTO dirs (parent, name) VALUES (?, ?)", key)
+            known[key] = cursor.lastrowid
+         did = known[key]
+      cursor.execute("INSERT INTO pathmap VALUES (?, ?)", (path, did))
+   # '/data/foo' and '/data/foo/' are the same folder, merge its files
+   cursor.execute("CREATE TEMP TABLE filemap (fid INTEGER PRIMARY KEY, keep INTEGER)")
+   cursor.execute("INSERT INTO filemap SELECT f.fid, k.keep FROM files f "
+                  "JOIN pathmap p ON p.path = f.f_path "
+                  "JOIN (SELECT q.did, g.f_name, MIN(g.fid) AS keep FROM files g "
+                  "JOIN pathmap q ON q.path = g.f_path GROUP BY q.did, g.f_name "
+                  "HAVING COUNT(*) > 1) k ON k.did = p.did AND k.f_name = f.f_name "
+                  "WHERE f.fid != k.keep")
+   cursor.execute("INSERT OR IGNORE INTO filetags SELECT m.keep, ft.tid "
+                  "FROM filemap m JOIN filetags ft ON ft.fid = m.fid")
+   cursor.execute("DELETE FROM filetags WHERE fid IN (SELECT fid FROM filemap)")
+   cursor.execute("DELETE FROM files WHERE fid IN (SELECT fid FROM filemap)")
+   cursor.execute("DROP TABLE filemap")
+   # new table for files, keep id-s
+   cursor.execute("CREATE TABLE files_new (fid INTEGER PRIMARY KEY, f_name TEXT NOT NULL, "
+                  "did INTEGER NOT NULL REFERENCES dirs ON DELETE CASCADE, "
+                  "UNIQUE(did, f_name))")
+   cursor.execute("INSERT INTO files_new SELECT fid, f_name, pathmap.did "
+                  "FROM files JOIN pathmap ON pathmap.path = files.f_path")
+   cursor.execute("DROP TABLE files")
+   cursor.execute("ALTER TABLE files_new RENAME TO files")
+   cursor.execute("DROP TABLE pathmap")
+   # triggers are removed with the old table, id-s are the same
+   cursor.execute("SELECT 1 FROM sqlite_master WHERE name='names'")
+   if cursor.fetchone(): nameTriggers(cursor)
+
+# (step, creates index)
+MIGRATIONS = [
+   (createBase, False),   # 1
+   (pathIndex, True),     # 2
+   (nameIndex, False),    # 3
+   (tagIndex, True),      # 4
+   (dirState, False),     # 5
+   (tagUsage, True),      # 6
+   (dirTree, True),       # 7
+]
+VERSION = len(MIGRATIONS)
+
+def hasColumn(cursor, table, column):
+   "Check if the table contains column"
+   cursor.execute("PRAGMA table_info(%s)" % table)
+   return column in [c[1] for c in cursor.fetchall()]
+
+def version(db):
+   "Current schema version"
+   return db.execute("PRAGMA user_version").fetchone()[0]
+
+def upgrade(db, target=VERSION):
+   "Apply missing steps up to the target version, each in its own transaction"
+   current = version(db)
+   if current >= target: return
+   db.commit()
+   # tables are rebuilt, don't delete links
+   db.execute("PRAGMA foreign_keys = OFF")
+   cursor = db.cursor()
+   analyze = False
+   for n in range(current, target):
+      step, has_index = MIGRATIONS[n]
+      # other process can do the same
+      cursor.execute("BEGIN IMMEDIATE")
+      if version(db) > n:
+         db.commit()
+         continue
+      try:
+         step(cursor)
+         cursor.execute("PRAGMA user_version = %d" % (n + 1))
+      except:
+         db.rollback()
+         raise
+      db.commit()
+      analyze = analyze or has_index
+   if analyze:
+      cursor.execute("ANALYZE")
+      db.commit()
@@ -0,0 +1,306 @@
+"""
+Optional time measurement for the tag base
+
+Profiler.attach(base) replaces the public methods of the TagBase object
+and its connection with measuring wrappers, detach() returns the
+originals back, so the base has no overhead when profiling is off.
+"""
+
+import re
+import time
+import inspect
+import threading
+from bisect import bisect_left
+from collections import deque
+
+BOUNDS = (0.0001, 0.0003, 0.001, 0.003, 0.01, 0.03, 0.1, 0.3, 1.0)  # s, histogram buckets
+SLOW = 0.05      # s, default limit for the slow query log
+LOG_SIZE = 50    # number of saved slow queries
+SKIP = ('transaction', 'reading', 'close', 'profile', 'profileStats', 'profileReport', 'printTables')
+EXPLAIN = ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+PARAM_LIST = re.compile(r'\?(\s*,\s*\?)+')   # 'IN (?,?,?)' has different length
+
+class Stats:
+   "Number of calls, time and rows for a method or statement"
+
+   def __init__(self):
+      self.count = 0
+      self.total = 0.0
+      self.max = 0.0
+      self.rows = 0
+      self.hist = [0] * (len(BOUNDS) + 1)
+
+   def add(self, dt, rows):
+      "Save one call"
+      self.count += 1
+      self.total += dt
+      self.max = max(self.max, dt)
+      self.rows += rows
+      self.hist[bisect_left(BOUNDS, dt)] += 1
+
+   def dump(self):
+      "Get dictionary"
+      return {'count': self.count, 'total': self.total, 'max': self.max,
+              'rows': self.rows, 'hist': list(self.hist)}
+
+def table(title, items, top):
+   "Lines of text for {name: Stats.dump()}, the longest first"
+   res = ["\n%s (calls, total ms, mean ms, max ms, rows, histogram)" % title]
+   lst = sorted(items.items(), key=lambda x: -x[1]['total'])
+   for name, s in lst[:top]:
+      res.append("%7d %10.1f %9.2f %9.1f %8d  %s" % (s['count'], s['total'] * 1000,
+                 s['total'] * 1000 / s['count'], s['max'] * 1000, s['rows'],
+                 ' '.join(str(h) for h in s['hist'])))
+      res.append("   " + ' '.join(name.split())[:300])
+   return res
+
+class Cursor:
+   "Cursor wrapper, statement is saved when all rows are read"
+
+   def __init__(self, cursor, prof):
+      self.cursor = cursor
+      self.prof = prof
+      self.current = None   # [sql, param, time, rows, method]
+
+   def __getattr__(self, name):
+      return getattr(self.cursor, name)
+
+   def __del__(self):
+      self.finish()
+
+   def finish(self):
+      "Save the current statement"
+      if self.current:
+         self.prof.statement(*self.current, db=self.cursor.connection)
+         self.current = None
+
+   def execute(self, sql, param=()):
+      self.finish()
+      t = time.perf_counter()
+      self.cursor.execute(sql, param)
+      self.current = [sql, param, time.perf_counter() - t, max(self.cursor.rowcount, 0),
+                      self.prof.caller()]
+      if self.cursor.description is None: self.finish()   # no rows to read
+      return self
+
+   def executemany(self, sql, seq):
+      self.finish()
+      seq = list(seq)
+      t = time.perf_counter()
+      self.cursor.executemany(sql, seq)
+      self.current = [sql, seq[0] if seq else (), time.perf_counter() - t,
+                      max(self.cursor.rowcount, 0), self.prof.caller()]
+      self.finish()
+      return self
+
+   def fetchone(self):
+      t = time.perf_counter()
+      row = self.cursor.fetchone()
+      if self.current:
+         self.current[2] += time.perf_counter() - t
+         if row is None:
+            self.finish()
+         else:
+            self.current[3] += 1
+      return row
+
+   def fetchmany(self, size=None):
+      t = time.perf_counter()
+      size = size or self.cursor.arraysize
+      rows = self.cursor.fetchmany(size)
+      if self.current:
+         self.current[2] += time.perf_counter() - t
+         self.current[3] += len(rows)
+         if len(rows) < size: self.finish()   # no more rows
+      return rows
+
+   def fetchall(self):
+      t = time.perf_counter()
+      rows = self.cursor.fetchall()
+      if self.current:
+         self.current[2] += time.perf_counter() - t
+         self.current[3] += len(rows)
+         self.finish()
+      return rows
+
+   def __iter__(self):
+      while True:
+         row = self.fetchone()
+         if row is None: return
+         yield row
+
+   def close(self):
+      self.finish()
+      self.cursor.close()
+
+class Connection:
+   "Connection wrapper which gives measuring cursors"
+
+   def __init__(self, db, prof):
+      self.db = db
+      self.prof = prof
+
+   def __getattr__(self, name):
+      return getattr(self.db, name)
+
+   def cursor(self):
+      return Cursor(self.db.cursor(), self.prof)
+
+   def execute(self, sql, param=()):
+      return self.cursor().execute(sql, param)
+
+   def executemany(self, sql, seq):
+      return self.cursor().executemany(sql, seq)
+
+class Profiler:
+   "Statistics for TagBase methods and SQL statements, log of slow queries"
+
+   def __init__(self, slow=SLOW, size=LOG_SIZE):
+      self.slow = slow
+      self.methods = {}      # name : Stats
+      self.statements = {}   # sql : Stats
+      self.log = deque(maxlen=size)
+      self.plans = {}        # sql : query plan
+      self.lock = threading.Lock()
+      self.local = threading.local()   # stack of called methods
+      self.base = None
+
+   def attach(self, base):
+      "Start measurement for the base"
+      self.base = base
+      self.db = base.db
+      conn = Connection(base.db, self)
+      for obj in (base, base.dirs):
+         obj.db = conn
+      for name, fn in inspect.getmembers(type(base), inspect.isfunction):
+         if name.startswith('_') or name in SKIP: continue
+         if inspect.isgeneratorfunction(fn):
+            setattr(base, name, self.wrapGenerator(name, getattr(base, name)))
+         else:
+            setattr(base, name, self.wrap(name, getattr(base, name)))
+
+   def share(self, base, name):
+      "Measure statements of other base, e.g. reading connection, in the current thread"
+      base.db = base.dirs.db = Connection(base.db, self)
+      self.stack()[:] = [name]
+
+   def detach(self):
+      "Return original methods and connection"
+      base, self.base = self.base, None
+      if base is None: return
+      for obj in (base, base.dirs):
+         obj.db = self.db
+      for name, fn in inspect.getmembers(type(base), inspect.isfunction):
+         base.__dict__.pop(name, None)
+
+   def stack(self):
+      "Methods called in the current thread"
+      if not hasattr(self.local, 'stack'): self.local.stack = []
+      return self.local.stack
+
+   def caller(self):
+      "The last called method"
+      stack = self.stack()
+      return stack[-1] if stack else None
+
+   def wrap(self, name, fn):
+      "Measure method call"
+      def call(*args, **kw):
+         stack = self.stack()
+         stack.append(name)
+         t, res = time.perf_counter(), None
+         try:
+            res = fn(*args, **kw)
+            return res
+         finally:
+            stack.pop()
+            self.method(name, time.perf_counter() - t,
+                        len(res) if isinstance(res, (list, dict, set, tuple)) else 0)
+      return call
+
+   def wrapGenerator(self, name, fn):
+      "Measure time of the generator steps"
+      def call(*args, **kw):
+         gen, dt, n = fn(*args, **kw), 0.0, 0
+         stack = self.stack()
+         try:
+            while True:
+               stack.append(name)
+               t = time.perf_counter()
+               try:
+                  item = next(gen)
+               except StopIteration:
+                  return
+               finally:
+                  dt += time.perf_counter() - t
+                  stack.pop()
+               n += 1
+               yield item
+         finally:
+            gen.close()
+            self.method(name, dt, n)
+      return call
+
+   def method(self, name, dt, rows):
+      "Save method call"
+      with self.lock:
+         self.methods.setdefault(name, Stats()).add(dt, rows)
+
+   def statement(self, sql, param, dt, rows, method, db=None):
+      "Save executed statement, remember it if it is slow, db is used for the plan"
+      key = PARAM_LIST.sub('?, ...', sql)
+      with self.lock:
+         self.statements.setdefault(key, Stats()).add(dt, rows)
+      if dt < self.slow: return
+      item = {'time': time.strftime('%H:%M:%S'), 'method': method,
+              'sql': sql, 'param': repr(param)[:200], 'duration': dt, 'rows': rows,
+              'plan': self.plan(sql, param, db or self.db)}
+      with self.lock:
+         self.log.append(item)
+
+   def plan(self, sql, param, db):
+      "Get EXPLAIN QUERY PLAN as lines of text"
+      if sql in self.plans: return self.plans[sql]
+      plan = []
+      if sql.lstrip().split(None, 1)[0].upper() in EXPLAIN:
+         try:
+            rows = db.execute("EXPLAIN QUERY PLAN " + sql, param).fetchall()
+         except Exception as e:
+            rows = [(0, 0, 0, "error: %s" % e)]
+         # indent children
+         level = {0: 0}
+         for node, parent, _, detail in rows:
+            level[node] = level.get(parent, 0) + 1
+            plan.append('  ' * (level[node] - 1) + detail)
+      self.plans[sql] = plan
+      return plan
+
+   def reset(self):
+      "Clear statistics"
+      with self.lock:
+         self.methods.clear()
+         self.statements.clear()
+         self.log.clear()
+
+   def dump(self):
+      "Get statistics as dictionary"
+      with self.lock:
+         return {'bounds': list(BOUNDS), 'slow': self.slow,
+                 'methods': {k: v.dump() for k, v in self.methods.items()},
+                 'statements': {k: v.dump() for k, v in self.statements.items()},
+                 'log': list(self.log)}
+
+   def report(self, top=20):
+      "Get statistics as text"
+      dump = self.dump()
+      res = ["Histogram bounds, ms: " + ' '.join('%g' % (b * 1000) for b in BOUNDS)]
+      res += table("Methods", dump['methods'], top)
+      res += table("Statements", dump['statements'], top)
+      res.append("\nSlow queries (%g ms and more)" % (self.slow * 1000))
+      for item in reversed(dump['log']):
+         res.append("%s %s %.1f ms, %d rows" % (item['time'], item['method'],
+                    item['duration'] * 1000, item['rows']))
+         res.append("   " + ' '.join(item['sql'].split()))
+         res.append("   " + item['param'])
+         res.extend("   | " + p for p in item['plan'])
+      return '\n'.join(res)
@@ -0,0 +1,48 @@
+"""
+Window for long operations
+"""
+
+from tkinter import Toplevel, Label, Button, StringVar
+
+class ProgressWindow:
+   "Run generator step by step inside the Tk loop, show its progress"
+
+   def __init__(self, master, title, steps, text):
+      self.slave = Toplevel(master)
+      self.slave.title(title)
+      self.steps = steps     # generator of (done, total)
+      self.text = text       # format for (done, total)
+      self.finished = False
+      # widgets
+      self.var = StringVar()
+      Label(self.slave, textvariable=self.var, width=40).pack(padx=10, pady=10)
+      Button(self.slave, text='Cancel', width=14, command=self.cancel).pack(pady=5)
+      # bind
+      self.slave.bind('<Escape>', lambda x: self.cancel())
+      self.slave.protocol('WM_DELETE_WINDOW', self.cancel)
+      self.slave.after(1, self.step)
+
+   def run(self):
+      "Wait for the end, return False if cancelled"
+      self.slave.grab_set()
+      self.slave.wait_window()
+      return self.finished
+
+   def step(self):
+      "Do next step"
+      try:
+         done, total = next(self.steps)
+      except StopIteration:
+         self.finished = True
+         self.slave.destroy()
+         return
+      except Exception:
+         self.slave.destroy()
+         raise
+      self.var.set(self.text % (done, total))
+      self.slave.after(1, self.step)
+
+   def cancel(self):
+      "Stop execution"
+      self.steps.close()
+      self.slave.destroy()
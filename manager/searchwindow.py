@@ -8,7 +8,12 @@ import tkinter.simpledialog as dlg
 import tkinter.messagebox as msg
 import os
 
+from .vocabulary import Completer
+from .tagquery import quote
+
 SHOW_TAGS, SHOW_FILES = 0, 1
+POLL = 20     # ms, check search results
+AHEAD = 0.9   # request the next page when this part of list is visible
 
 class SearchWindow:
    "Window for file search using tags"
@@ -20,7 +25,7 @@ class SearchWindow:
       self.files = Frame(self.slave)
       self.file_lst = Listbox(self.files, selectmode='single', height=20, font='Verdanda 10')
       self.scroll = Scrollbar(self.files, command=self.file_lst.yview)
-      self.file_lst.configure(yscrollcommand=self.scroll.set)
+      self.file_lst.configure(yscrollcommand=self.scrolled)
       self.files.pack(side='top', fill='x', expand=1)
       self.file_lst.pack(side='left', fill='both', expand=1)
       self.scroll.pack(side='right', fill='y')
@@ -49,14 +54,14 @@ class SearchWindow:
       self.file_lst.bind('<Double-ButtonRelease-1>', self.exec)
       self.file_lst.bind('<Return>', self.exec)
       self.file_lst.bind('<ButtonRelease-3>', self.callMenu)
-      self.slave.bind('<Escape>', lambda x: self.slave.destroy())
+      self.slave.bind('<Escape>', self.escape)
       self.slave.bind('<Control-o>', self.openPath)
       # state
       self.open_path = None
       self.state = SHOW_TAGS
-      self.last_tag = ""
-      self.last_tag_lst = []
-      self.last_tag_num = 0
+      self.stream = None   # running search
+      self.total = None    # number of found files
+      self.completer = Completer(self.fo.vocab)
       # show all tags
       self.tags = self.fo.tagList()
       self.reset(1)
@@ -67,10 +72,12 @@ class SearchWindow:
       #self.slave.focus_set()
       self.tags_edt.focus_set()
       self.slave.wait_window()
+      self.cancel()
       return self.open_path
 
    def reset(self, ev):
       "Clear window, add list of tags"
+      self.cancel()
       self.state = SHOW_TAGS
       self.files = []
       self.file_lst.delete(0, 'end')
@@ -82,23 +89,74 @@ class SearchWindow:
       #self.file_lst.focus_set()
 
    def printFiles(self, ev):
-      "Show result of search"
+      "Start search, the previous one is cancelled"
+      # get query
+      tag_str = self.var.get().strip()
+      if not tag_str: return
+      self.cancel()
       self.state = SHOW_FILES
-      # get tags
-      tag_str = self.var.get()
-      tag_lst = [s.strip() for s in tag_str.split(',')]
-      if not tag_lst: return
-      # find and show files
-      tmp = tag_lst[0]
-      if tmp.startswith('?'):    # try to find files with given part of name
-         self.files = self.fo.findByName(tmp.strip('? '))
-      else:
-         self.files = self.fo.findFiles(tag_lst)
-      self.slave.title("Found: %d" % len(self.files))
+      self.files, self.total = [], None
       self.file_lst.delete(0, 'end')
       self.file_lst['fg'] = 'black'
-      for grp in self.files:
-         self.file_lst.insert('end', self.represent(grp))
+      # find files with given part of name or use query
+      by_name = tag_str.startswith('?') and ',' not in tag_str
+      self.stream = self.fo.search(tag_str.strip('? ') if by_name else tag_str, by_name)
+      self.showCount()
+      self.slave.after(POLL, self.poll)
+
+   def poll(self):
+      "Show new pages of the search result"
+      stream = self.stream
+      if stream is None or not self.slave.winfo_exists(): return
+      for kind, value in stream.get():
+         if kind == 'page':
+            self.files.extend(value)
+            self.file_lst.insert('end', *[self.represent(grp) for grp in value])
+         elif kind == 'count':
+            self.total = value
+         elif kind == 'error':
+            self.stream = None
+            msg.showerror("Query", str(value))
+         elif kind == 'end':
+            self.stream = None
+      self.showCount()
+      if self.stream is stream:
+         self.checkView()
+         self.slave.after(POLL, self.poll)
+
+   def showCount(self):
+      "Number of files in title"
+      if self.total is None:
+         self.slave.title("Searching... %d" % len(self.files))
+      elif len(self.files) < self.total:
+         self.slave.title("Found: %d of %d" % (len(self.files), self.total))
+      else:
+         self.slave.title("Found: %d" % self.total)
+
+   def scrolled(self, first, last):
+      "Move scrollbar, get more files if the end is visible"
+      self.scroll.set(first, last)
+      self.checkView()
+
+   def checkView(self):
+      "Request the next page when the list is scrolled down"
+      if self.stream and float(self.file_lst.yview()[1]) >= AHEAD:
+         self.stream.more()
+
+   def cancel(self):
+      "Stop the running search"
+      if self.stream:
+         self.stream.cancel()
+         self.stream = None
+         return True
+      return False
+
+   def escape(self, ev):
+      "Cancel search or close window"
+      if self.cancel():
+         self.slave.title("Cancelled, found: %d" % len(self.files))
+      else:
+         self.slave.destroy()
 
    def represent(self, grp):
       "String with file representation"
@@ -117,7 +175,7 @@ class SearchWindow:
          current = self.files[self.file_lst.index('active')]
          return self.fo.execute(os.path.join(*current))
       else:
-         add_tag = self.file_lst.get('active')
+         add_tag = quote(self.file_lst.get('active'))
          cur_tag = self.var.get()
          self.var.set((cur_tag + ', ' + add_tag) if cur_tag else add_tag)
 
@@ -152,22 +210,5 @@ class SearchWindow:
 
    def wordComplete(self, ev):
       "Complete tag name"
-      # get last tag
-      tag_str = self.var.get()
-      tag_lst = [s.strip() for s in tag_str.split(',')]
-      start = tag_lst[-1]
-      if start == "": return
-      # find equial tags in base
-      if start.startswith(self.last_tag) and len(self.last_tag_lst) > 0:
-         self.last_tag_num = (self.last_tag_num + 1) % len(self.last_tag_lst)
-      else:
-         self.last_tag_lst = self.fo.tagsStartsWith(start)
-         if len(self.last_tag_lst) == 0: return
-         self.last_tag, self.last_tag_num = start, 0
-      # update string
-      tag_lst[-1] = self.last_tag_lst[self.last_tag_num]
-      self.var.set(', '.join(tag_lst))
-
-
-
-
+      text = self.completer.next(self.var.get())
+      if text is not None: self.var.set(text)
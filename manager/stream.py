@@ -0,0 +1,94 @@
+"""
+Search results by pages
+
+The query is executed in a separate thread with its own read-only
+connection. The cursor stays open between pages, the next page is
+read only when it is requested, so a large result is never kept in
+memory. The number of results is found by a separate COUNT query
+after the first page.
+"""
+
+import queue
+import sqlite3
+import threading
+
+from .tagbase import TagBase
+
+PAGE = 300   # rows in one page
+
+class SearchStream:
+   "Run search in background, read messages with get()"
+
+   def __init__(self, db_path, request, page=PAGE, profiler=None):
+      self.db_path = db_path
+      self.request = request   # function(base) -> (sql, parameters) or None
+      self.profiler = profiler   # statistics of the main base
+      self.page = page
+      self.messages = queue.Queue()   # (kind, value)
+      self.wanted = 1      # pages requested by the window
+      self.sent = 0        # pages sent
+      self.finished = False
+      self.cancelled = False
+      self.base = None
+      self.cond = threading.Condition()
+      threading.Thread(target=self.run, daemon=True).start()
+
+   def more(self):
+      "Request the next page"
+      with self.cond:
+         if self.wanted <= self.sent:
+            self.wanted = self.sent + 1
+            self.cond.notify()
+
+   def cancel(self):
+      "Stop search"
+      with self.cond:
+         self.cancelled = True
+         self.cond.notify()
+         if self.base and not self.finished: self.base.db.interrupt()
+
+   def get(self):
+      "List of new (kind, value) messages: page, count, error, end"
+      res = []
+      while not self.messages.empty():
+         res.append(self.messages.get())
+      return res
+
+   def run(self):
+      "Read pages when they are requested"
+      cursor = None
+      try:
+         with self.cond:
+            if self.cancelled: return
+            self.base = TagBase(self.db_path, readonly=True)
+         base = self.base
+         if self.profiler: self.profiler.share(base, 'SearchStream')
+         req = self.request(base)
+         if req is None:
+            self.messages.put(('count', 0))
+            return
+         cursor = base.db.cursor()
+         cursor.execute(*req)
+         while True:
+            with self.cond:
+               while self.wanted <= self.sent and not self.cancelled:
+                  self.cond.wait()
+               if self.cancelled: return
+            rows = cursor.fetchmany(self.page)
+            self.messages.put(('page', base.dirs.named(rows)))
+            self.sent += 1
+            if self.sent == 1 and len(rows) < self.page:
+               self.messages.put(('count', len(rows)))
+            elif self.sent == 1:
+               # total number, the first page is already shown
+               total = base.db.execute("SELECT COUNT(*) FROM (%s)" % req[0], req[1]).fetchone()
+               self.messages.put(('count', total[0]))
+            if len(rows) < self.page: return
+      except Exception as e:
+         if not self.cancelled: self.messages.put(('error', e))
+      finally:
+         with self.cond:
+            self.finished = True
+         self.messages.put(('end', None))
+         if cursor is not None: cursor.close()
+         if self.base: self.base.close()
@@ -4,45 +4,150 @@ Database manager commands
 
 import sqlite3
 import os
+import time
 import random
+from contextlib import contextmanager
+
+from .tagquery import parse, Planner
+from .dirtree import DirTree
+from .migrations import upgrade
+from .connection import connect, isBusy, DataVersion, ReadPool, RETRIES, BACKOFF
+
+READERS = 2   # default size of the read connection pool
 
 class TagBase:
    "Management of SQLite3 data base"
 
-   def __init__(self, db_name):
-      # check base, open
-      new_base = not os.path.exists(db_name)
-      self.db = sqlite3.connect(db_name)
+   def __init__(self, db_name, vocab=None, readonly=False, readers=READERS):
+      # open, update schema if need
+      self.db = connect(db_name, readonly)
+      self.db_path = db_name
       self.db_name = os.path.split(db_name)[1]
-      cursor = self.db.cursor()
-      cursor.execute("PRAGMA foreign_keys = ON")
-      # create new if need
-      if new_base:
-         cursor.execute("CREATE TABLE files (fid INTEGER PRIMARY KEY, "
-                        "f_name TEXT NOT NULL, f_path TEXT NOT NULL,"
-                        "UNIQUE(f_name, f_path))")
-         cursor.execute("CREATE TABLE tags (tid INTEGER PRIMARY KEY, "
-                        "t_name TEXT NOT NULL UNIQUE)")
-         cursor.execute("CREATE TABLE filetags (fid INTEGER, tid INTEGER,"
-                        "PRIMARY KEY(fid, tid), "
-                        "FOREIGN KEY(fid) REFERENCES files ON DELETE CASCADE, "
-                        "FOREIGN KEY(tid) REFERENCES tags ON DELETE CASCADE)")
-         # delete tags if they are not more in use
-         cursor.execute("CREATE TRIGGER tag_del AFTER DELETE ON files "
-                        "BEGIN "
-                        "DELETE FROM tags WHERE tid NOT IN "
-                        "(SELECT DISTINCT tid FROM filetags); "
-                        "END")
-      self.db.commit()
+      if not readonly: upgrade(self.db)
+      self.db.execute("PRAGMA foreign_keys = ON")
+      # commits of other connections, see sync()
+      self.version = DataVersion(self.db)
+      self.dirs = DirTree(self.db)
+      self.fts = self.db.execute("SELECT 1 FROM sqlite_master WHERE name='names'").fetchone() is not None
+      # transaction depth, see transaction()
+      self.depth = 0
+      self.garbage = False   # some tags can be unused
+      # optional tag names for completion
+      self.vocab = vocab
+      if vocab is not None: self.watchTags()
+      # optional query statistics, see profile()
+      self.profiler = None
+      # connections for other threads, see reading()
+      self.pool = ReadPool(lambda: TagBase(db_name, readonly=True), readers)
       # prepare random
       random.seed()
 
+   def profile(self, on=True, slow=None):
+      "Start or stop measurement of methods and queries, statistics are kept"
+      if self.profiler: self.profiler.detach()
+      if on:
+         # loaded only when it is used
+         from .profiler import Profiler
+         self.profiler = Profiler() if slow is None else Profiler(slow)
+         self.profiler.attach(self)
+
+   def profileStats(self):
+      "Dictionary with the last statistics, None if profiling was not used"
+      return self.profiler.dump() if self.profiler else None
+
+   def profileReport(self):
+      "Statistics as text"
+      return self.profiler.report() if self.profiler else "Profiling is off"
+
+   def sync(self, locked=False):
+      "Forget saved data if the base was changed by other connection"
+      if not self.version.changed(locked): return
+      self.dirs.clear()
+      if self.vocab is not None: self.watchTags()
+
+   @contextmanager
+   def reading(self):
+      "Read-only base for the current thread, taken from pool"
+      with self.pool.get() as base:
+         base.sync()
+         yield base
+
+   def retry(self, fn, *args):
+      "Execute fn in transaction, repeat it when the base is locked by other process"
+      for i in range(RETRIES):
+         try:
+            with self.transaction():
+               return fn(*args)
+         except sqlite3.OperationalError as e:
+            # inner transaction can't be repeated
+            if not isBusy(e) or self.depth > 0 or i == RETRIES - 1: raise
+            time.sleep(BACKOFF * 2 ** i * random.uniform(0.5, 1.5))
+
+   def collect(self):
+      "Remove tags without files"
+      if self.garbage:
+         self.db.cursor().execute("DELETE FROM tags WHERE t_usage <= 0")
+         self.garbage = False
+
+   def watchTags(self):
+      "Load vocabulary, remember changed tags to update it after commit"
+      cursor = self.db.cursor()
+      cursor.execute("CREATE TEMP TABLE IF NOT EXISTS tagchanges (t_name TEXT PRIMARY KEY)")
+      for event, names in (("INSERT", ("new",)), ("DELETE", ("old",)),
+                           ("UPDATE OF t_name, t_usage", ("old", "new"))):
+         cursor.execute("CREATE TEMP TRIGGER IF NOT EXISTS tagchanges_%s AFTER %s ON tags "
+                        "BEGIN %s END" % (event.split()[0].lower(), event,
+                        " ".join("INSERT OR IGNORE INTO tagchanges VALUES (%s.t_name);" % n
+                                 for n in names)))
+      cursor.execute("SELECT t_name, t_usage FROM tags")
+      self.vocab.load(cursor.fetchall())
+
+   def syncTags(self):
+      "Apply changes of tags to vocabulary"
+      cursor = self.db.cursor()
+      cursor.execute("SELECT c.t_name, t.t_usage FROM tagchanges c "
+                     "LEFT JOIN tags t ON t.t_name = c.t_name")
+      for name, usage in cursor.fetchall():
+         if usage is None:
+            self.vocab.remove(name)
+         else:
+            self.vocab.set(name, usage)
+      cursor.execute("DELETE FROM tagchanges")
+
+   @contextmanager
+   def transaction(self):
+      "Group all modifications inside 'with' block into one commit"
+      if self.depth == 0:
+         # lock before reading, so other process can't change what is read
+         if not self.db.in_transaction: self.db.execute("BEGIN IMMEDIATE")
+         self.sync(True)
+      self.depth += 1
+      try:
+         yield self
+      except:
+         self.depth -= 1
+         if self.depth == 0:
+            self.db.rollback()
+            self.dirs.clear()
+            self.garbage = False
+         raise
+      self.depth -= 1
+      self.commit()
+
+   def commit(self):
+      "Commit changes when there is no open transaction"
+      if self.depth == 0:
+         self.collect()
+         if self.vocab is not None: self.syncTags()
+         self.db.commit()
+
    def addFile(self, path, nm):
       "Insert new file"
       # insert
       cursor = self.db.cursor()
-      cursor.execute("INSERT INTO files VALUES (null, ?, ?)", (nm, path))
-      self.db.commit()
+      cursor.execute("INSERT INTO files (f_name, did) VALUES (?, ?)",
+                     (nm, self.dirs.find(path, True)))
+      self.commit()
       # get id
       cursor.execute("SELECT last_insert_rowid()")
       f_id = cursor.fetchone()
@@ -51,7 +156,8 @@ class TagBase:
    def fileId(self, path, nm):
       "Get file index"
       cursor = self.db.cursor()
-      cursor.execute("SELECT fid FROM files WHERE f_name=? AND f_path=?", (nm, path))
+      cursor.execute("SELECT fid FROM files WHERE f_name=? AND did=?",
+                     (nm, self.dirs.find(path)))
       f_id = cursor.fetchone()
       return f_id[0] if f_id else -1
 
@@ -59,8 +165,8 @@ class TagBase:
       "Insert new tag"
       # insert
       cursor = self.db.cursor()
-      cursor.execute("INSERT INTO tags VALUES (null, ?)", (tag.lower(),))
-      self.db.commit()
+      cursor.execute("INSERT INTO tags (t_name) VALUES (?)", (tag.lower(),))
+      self.commit()
       # get id
       cursor.execute("SELECT last_insert_rowid()")
       t_id = cursor.fetchone()
@@ -75,53 +181,71 @@ class TagBase:
 
    def tagsToFile(self, path, nm, tags):
       "Bind tags to file"
-      # find file, add if need
-      f_id = self.fileId(path, nm)
-      if f_id == -1: f_id = self.addFile(path, nm)
-      # link tags
-      for tag in tags:
-         if tag == "": continue   # eliminate empty strings
-         # find or add tag
-         t_id = self.tagId(tag)
-         if t_id==-1: t_id = self.addTag(tag)
-         # insert
-         self.db.cursor().execute("INSERT INTO filetags VALUES (?, ?)", (f_id, t_id))
-      self.db.commit()
+      self.tagsToFiles([(path, nm, tags)])
+
+   def tagsToFiles(self, items):
+      "Bind tags to many files, items is a sequence of (path, name, tags)"
+      files, tags, links = [], set(), []
+      for path, nm, lst in items:
+         did = self.dirs.find(path, True)
+         files.append((nm, did))
+         for tag in lst:
+            if tag == "": continue   # eliminate empty strings
+            tag = tag.lower()
+            tags.add((tag,))
+            links.append((nm, did, tag))
+      cursor = self.db.cursor()
+      # add new files and tags, then link them
+      cursor.executemany("INSERT OR IGNORE INTO files (f_name, did) VALUES (?, ?)", files)
+      cursor.executemany("INSERT OR IGNORE INTO tags (t_name) VALUES (?)", tags)
+      cursor.executemany("INSERT OR IGNORE INTO filetags SELECT f.fid, t.tid "
+                         "FROM files f, tags t "
+                         "WHERE f.f_name=? AND f.did=? AND t.t_name=?", links)
+      self.commit()
 
    def delFile(self, path, nm):
       "Delete file from database"
-      self.db.cursor().execute("DELETE FROM files WHERE f_name=? AND f_path=?", (nm, path))
-      self.db.commit()
+      self.garbage = True
+      self.db.cursor().execute("DELETE FROM files WHERE f_name=? AND did=?",
+                               (nm, self.dirs.find(path)))
+      self.commit()
 
    def delFolder(self, path):
       "Delete all contestant of folder from database"
-      self.db.cursor().execute("DELETE FROM files WHERE f_path LIKE ?",
-                                (path+'%',))
-      self.db.commit()
+      self.garbage = True
+      did = self.dirs.find(path)
+      if did == -1: return
+      # files and subfolders are removed by cascade
+      self.dirs.remove(did)
+      self.commit()
 
    def delTag(self, tname):
       "Delete tag with given name"
       self.db.cursor().execute("DELETE FROM tags WHERE t_name=?", (tname,))
-      self.db.commit()
-
+      self.commit()
 
    def changeFileName(self, new_nm, path, old_nm):
       "Change file name"
-      self.db.cursor().execute("UPDATE files SET f_name=? WHERE f_name=? AND f_path=?",
-                               (new_nm, old_nm, path))
-      self.db.commit()
+      self.db.cursor().execute("UPDATE files SET f_name=? WHERE f_name=? AND did=?",
+                               (new_nm, old_nm, self.dirs.find(path)))
+      self.commit()
 
    def changeFilePath(self, new_path, old_path, nm):
       "Change path to file"
-      self.db.cursor().execute("UPDATE files SET f_path=? WHERE f_name=? AND f_path=?",
-                               (new_path, nm, old_path))
-      self.db.commit()
+      did = self.dirs.find(old_path)
+      if did == -1 or self.fileId(old_path, nm) == -1: return
+      self.db.cursor().execute("UPDATE files SET did=? WHERE f_name=? AND did=?",
+                               (self.dirs.find(new_path, True), nm, did))
+      self.commit()
 
    def changeDirPath(self, new_path, old_path):
       "Change path to directory"
-      self.db.cursor().execute("UPDATE files SET f_path=REPLACE(f_path, ?, ?) "
-                               "WHERE f_path LIKE ?", (old_path, new_path, old_path+'%'))
-      self.db.commit()
+      did = self.dirs.find(old_path)
+      if did == -1: return
+      with self.transaction():
+         # remove old records about the destination
+         self.delFolder(new_path)
+         self.dirs.move(did, new_path)
 
    def baseInfo(self):
       "Get information about database"
@@ -138,69 +262,160 @@ class TagBase:
       tag_id = []
       for tag in tags:
          _id = self.tagId(tag)
-         if _id != -1: tag_id.append(str(_id))
+         if _id != -1: tag_id.append(_id)
       cursor = self.db.cursor()
-      cursor.execute("SELECT f_path, f_name FROM files WHERE fid IN "
+      cursor.execute("SELECT did, f_name FROM files WHERE fid IN "
                      "(SELECT fid FROM filetags WHERE tid IN ({0}) "
-                     "GROUP BY fid HAVING COUNT(*) >= {1})".format(','.join(tag_id), len(tag_id)))
+                     "GROUP BY fid HAVING COUNT(*) >= ?)".format(','.join('?' * len(tag_id))),
+                     tag_id + [len(tag_id)])
       # return list of files (path, name)
-      return cursor.fetchall()
+      return self.dirs.named(cursor.fetchall())
+
+   def querySql(self, text):
+      "Get (sql, parameters) for boolean query, None if nothing can be found"
+      node = parse(text)
+      return Planner(self.db, self.dirs).plan(node) if node else None
+
+   def query(self, text):
+      "Find files using boolean query, see tagquery"
+      req = self.querySql(text)
+      if req is None: return []
+      cursor = self.db.cursor()
+      cursor.execute(*req)
+      return self.dirs.named(cursor.fetchall())
+
+   def filesById(self, fids):
+      "Get list of (path, name) for given file id-s"
+      cursor = self.db.cursor()
+      res = []
+      for i in range(0, len(fids), 500):
+         part = fids[i:i+500]
+         cursor.execute("SELECT did, f_name FROM files WHERE fid IN (%s)" %
+                        ','.join('?' * len(part)), part)
+         res.extend(cursor.fetchall())
+      return self.dirs.named(res)
+
+   def nameSql(self, nm):
+      "Get (sql, parameters) for search by name, None if there are no words"
+      words = nm.split()
+      if not words: return None
+      # trigram index works for words with 3 and more letters
+      long_words = [w for w in words if len(w) >= 3] if self.fts else []
+      cond = ["files.f_name LIKE ?"] * (len(words) - len(long_words))
+      param = ['%'+w+'%' for w in words if w not in long_words]
+      if long_words:
+         query = ' '.join('"%s"' % w.replace('"', '""') for w in long_words)
+         return ("SELECT did, files.f_name FROM names JOIN files ON fid = names.rowid "
+                 "WHERE names MATCH ? " + ''.join(" AND " + c for c in cond) +
+                 " ORDER BY rank", [query] + param)
+      return ("SELECT did, f_name FROM files WHERE " + " AND ".join(cond), param)
 
    def findByName(self, nm):
+      "Find files which names contain all the given words"
+      req = self.nameSql(nm)
+      if req is None: return []
       cursor = self.db.cursor()
-      cursor.execute("SELECT f_path, f_name FROM files WHERE f_name LIKE ?", ('%'+nm+'%',))
-      return cursor.fetchall()
-   
+      cursor.execute(*req)
+      return self.dirs.named(cursor.fetchall())
+
    def getFileTags(self, path, nm):
       "Get tags for current file"
       cursor = self.db.cursor()
       cursor.execute("SELECT t_name FROM tags NATURAL JOIN filetags NATURAL JOIN files f "
-                     "WHERE f.f_name=? AND f.f_path=?", (nm, path))
+                     "WHERE f.f_name=? AND f.did=?", (nm, self.dirs.find(path)))
       return [tag[0] for tag in cursor.fetchall()]
 
+   def getDirTags(self, path):
+      "Get dictionary {name: tags} for all tagged files in directory"
+      cursor = self.db.cursor()
+      cursor.execute("SELECT f.f_name, t.t_name FROM files f "
+                     "JOIN filetags ft ON ft.fid = f.fid JOIN tags t ON t.tid = ft.tid "
+                     "WHERE f.did=?", (self.dirs.find(path),))
+      res = {}
+      for nm, tag in cursor:
+         res.setdefault(nm, []).append(tag)
+      return res
+
    def breakLink(self, path, nm, tag):
       "Break link between file and tag"
-      self.db.cursor().execute("DELETE FROM filetags WHERE "
-         "fid = (SELECT f.fid FROM files f WHERE f.f_name=? AND f.f_path=?) AND "
-         "tid = (SELECT t.tid FROM tags t WHERE t.t_name=?)", (nm, path, tag))
-      self.db.commit()
+      self.breakLinks(path, nm, [tag])
+
+   def breakLinks(self, path, nm, tags):
+      "Break links between file and list of tags"
+      self.garbage = True
+      did = self.dirs.find(path)
+      links = [(nm, did, tag) for tag in tags]
+      self.db.cursor().executemany("DELETE FROM filetags WHERE "
+         "fid = (SELECT f.fid FROM files f WHERE f.f_name=? AND f.did=?) AND "
+         "tid = (SELECT t.tid FROM tags t WHERE t.t_name=?)", links)
+      self.commit()
 
    def updateFileTags(self, path, nm, new_tags):
       "Update list of tags for given file"
       old_tags = self.getFileTags(path, nm)
       t_add = [i for i in new_tags if i not in old_tags]  # tags for adding
       t_rem = [j for j in old_tags if j not in new_tags]  # tags for removing
-      # remove
-      for r in t_rem:
-         self.breakLink(path, nm, r)
-      # add
-      if t_add:
-         self.tagsToFile(path, nm, t_add)
+      with self.transaction():
+         # remove
+         if t_rem:
+            self.breakLinks(path, nm, t_rem)
+         # add
+         if t_add:
+            self.tagsToFile(path, nm, t_add)
 
    def addFileCopy(self, copy_path, path, nm):
       "Add copy of file"
-      tags = self.getFileTags(path, nm)
-      if tags:
-         self.tagsToFile(copy_path, nm, tags)
+      self.addFilesCopy([(copy_path, path, nm)])
+
+   def addFilesCopy(self, items):
+      "Add copies of files, items is a sequence of (copy path, path, name)"
+      cursor = self.db.cursor()
+      param = []
+      for copy_path, path, nm in items:
+         did = self.dirs.find(path)
+         if did == -1: continue
+         cursor.execute("SELECT 1 FROM files f WHERE f.did=? AND f.f_name=? AND "
+                        "EXISTS (SELECT 1 FROM filetags WHERE fid = f.fid)", (did, nm))
+         if cursor.fetchone():
+            param.append((self.dirs.find(copy_path, True), did, nm))
+      if not param: return
+      cursor.executemany("INSERT OR IGNORE INTO files (f_name, did) "
+                         "SELECT f_name, ? FROM files WHERE did=? AND f_name=?", param)
+      links = ("FROM files f JOIN filetags ft ON ft.fid = f.fid "
+               "JOIN files n ON n.did = ? AND n.f_name = f.f_name WHERE f.did=? AND f.f_name=?")
+      cursor.executemany("INSERT OR IGNORE INTO filetags SELECT n.fid, ft.tid " + links, param)
+      self.commit()
 
    def addDirCopy(self, dst_path, src_path):
       "Add copy of whole directory"
-      cursor = self.db.cursor()
-      # get files from source directory
-      cursor.execute("SELECT f_path, f_name FROM files WHERE f_path LIKE ?", (src_path+'%',))
-      file_lst = cursor.fetchall()
-      # add new files
-      for f in file_lst:
-         tags = self.getFileTags(*f)
-         if tags:
-            self.tagsToFile(f[0].replace(src_path, dst_path), f[1], tags)
+      did = self.dirs.find(src_path)
+      if did == -1: return
+      with self.transaction():
+         self.copyLinks(self.dirs.copy(did, dst_path))
 
+   def copyLinks(self, dirmap):
+      "Copy tagged files with their links, dirmap is {source did: copy did}"
+      cursor = self.db.cursor()
+      cursor.execute("CREATE TEMP TABLE IF NOT EXISTS dirmap "
+                     "(src INTEGER PRIMARY KEY, dst INTEGER)")
+      cursor.execute("DELETE FROM dirmap")
+      cursor.executemany("INSERT INTO dirmap VALUES (?, ?)", dirmap.items())
+      # files first, then links joined on the new fids
+      cursor.execute("INSERT OR IGNORE INTO files (f_name, did) "
+                     "SELECT f.f_name, m.dst FROM dirmap m JOIN files f ON f.did = m.src "
+                     "WHERE EXISTS (SELECT 1 FROM filetags WHERE fid = f.fid)")
+      links = ("FROM dirmap m JOIN files f ON f.did = m.src "
+               "JOIN filetags ft ON ft.fid = f.fid "
+               "JOIN files n ON n.did = m.dst AND n.f_name = f.f_name")
+      cursor.execute("INSERT OR IGNORE INTO filetags SELECT n.fid, ft.tid " + links)
+      cursor.execute("DELETE FROM dirmap")
+      self.commit()
 
    def tagRename(self, new_tag, old_tag):
       "Change tag name"
       self.db.cursor().execute("UPDATE tags SET t_name=? WHERE t_name=?",
                                (new_tag, old_tag))
-      self.db.commit()
+      self.commit()
 
    def tagList(self):
       "List of all tags"
@@ -208,14 +423,61 @@ class TagBase:
       cursor.execute("SELECT t_name FROM tags ORDER BY t_name")
       return [tag[0] for tag in cursor.fetchall()]
 
-   def correct(self):
-      "Remove files which are no more exists"
+   def correct(self, incremental=False, workers=8):
+      "Remove files which are no more exists, yield (checked, total) folders"
+      # slow import, not needed for queries
+      from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+      cursor = self.db.cursor()
+      # group files by folder
+      cursor.execute("SELECT did, f_name, fid FROM files")
+      folders = {}
+      for did, nm, fid in cursor.fetchall():
+         folders.setdefault(self.dirs.path(did), {})[nm] = fid
+      known = {}
+      if incremental:
+         cursor.execute("SELECT d_path, d_mtime FROM dirstate")
+         known = dict(cursor.fetchall())
+      # check folders in parallel, remove files when results are ready
+      pool = ThreadPoolExecutor(workers)
+      try:
+         pending = {pool.submit(scanDir, path, known.get(path)): path for path in folders}
+         checked, total = 0, len(pending)
+         while pending:
+            done = wait(pending, timeout=0.1, return_when=FIRST_COMPLETED)[0]
+            missing, state, gone = [], [], []
+            for fut in done:
+               path = pending.pop(fut)
+               mtime, names = fut.result()
+               if names is None: continue   # nothing to check
+               missing.extend(fid for nm, fid in folders[path].items() if nm not in names)
+               if mtime is None:
+                  gone.append((path,))
+               else:
+                  state.append((path, mtime))
+            with self.transaction():
+               self.delFiles(missing)
+               cursor.executemany("DELETE FROM dirstate WHERE d_path=?", gone)
+               cursor.executemany("INSERT OR REPLACE INTO dirstate VALUES (?, ?)", state)
+            checked += len(done)
+            yield checked, total
+      finally:
+         pool.shutdown(wait=False, cancel_futures=True)
+
+   def delFiles(self, fids):
+      "Delete files with given id-s"
+      if not fids: return
+      self.garbage = True
+      self.db.cursor().executemany("DELETE FROM files WHERE fid=?", [(f,) for f in fids])
+      self.commit()
+
+   def allFiles(self):
+      "Get (path, name, tags) for each file in base"
       cursor = self.db.cursor()
-      # get all files
-      cursor.execute("SELECT f_path, f_name FROM files")
-      # remove if not exist
-      for f in cursor.fetchall():
-         if not os.path.exists(os.path.join(*f)): self.delFile(*f)
+      cursor.execute("SELECT f.did, f.f_name, group_concat(t.t_name, ',') FROM files f "
+                     "JOIN filetags ft ON ft.fid = f.fid JOIN tags t ON t.tid = ft.tid "
+                     "GROUP BY f.fid ORDER BY f.did")
+      for did, nm, tags in cursor:
+         yield self.dirs.path(did), nm, tags.split(',')
 
    def tagsStartsWith(self, start):
       "Find tags which starts with current word"
@@ -227,6 +489,9 @@ class TagBase:
    def printTables(self):
       "Debug: print tables"
       cursor = self.db.cursor()
+      cursor.execute("SELECT * FROM dirs")
+      print("\nDirs")
+      for d in cursor.fetchall(): print(d)
       cursor.execute("SELECT * FROM files")
       print("\nFiles")
       for f in cursor.fetchall(): print(f)
@@ -239,6 +504,7 @@ class TagBase:
 
    def close(self):
       "Close database"
+      self.pool.close()
       self.db.close()
       
    def getRandom(self):
@@ -252,8 +518,22 @@ class TagBase:
       if a == b:
          return ""
       while True:
-         cursor.execute("SELECT f_path, f_name FROM files WHERE fid=?", (random.randint(a,b),))
+         cursor.execute("SELECT did, f_name FROM files WHERE fid=?", (random.randint(a,b),))
          lst = cursor.fetchone()
          if lst:
-            return os.path.join(*lst)
+            return os.path.join(*self.dirs.named([lst])[0])
 
+def scanDir(path, mtime=None):
+   "Get (modification time, set of names) for folder"
+   try:
+      current = os.stat(path).st_mtime_ns
+   except (FileNotFoundError, NotADirectoryError):
+      return None, set()   # folder is removed
+   except OSError:
+      return None, None    # no access, don't touch
+   if current == mtime:
+      return current, None   # not changed
+   try:
+      return current, set(os.listdir(path))
+   except OSError:
+      return None, None
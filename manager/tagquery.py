@@ -0,0 +1,232 @@
+"""
+Boolean query language for file search
+
+   cat, dog            - both tags (same as 'cat AND dog')
+   cat OR dog, cat | dog
+   NOT cat, !cat
+   (cat OR dog), mouse
+   photo*              - any tag with the given prefix
+   in:/data/scans      - files inside the folder
+   ext:pdf             - file type
+   name:word, ?word    - part of the file name
+   "NOT", "r&b"        - quotes for tags with keywords or symbols, "" for quote
+   cat in:/data        - filter after space starts a new term
+"""
+
+import re
+
+from .dirtree import SUBTREE
+
+TOKEN = re.compile(r'\s*(?:([(),|&!])|"((?:[^"]|"")*)"|([^(),|&!"]+))')
+FILTERS = ('in:', 'ext:', 'name:')
+KEYWORDS = {'AND': '&', 'OR': '|', 'NOT': '!'}
+
+# probability estimation for filters without statistics
+GUESS = {'in': 0.1, 'ext': 0.2, 'name': 0.05}
+
+def tokenize(text):
+   "Split query into operators and terms"
+   res, pos = [], 0
+   text = text.strip()
+   while pos < len(text):
+      m = TOKEN.match(text, pos)
+      if not m: raise ValueError("Unexpected symbol: " + text[pos:])
+      pos = m.end()
+      op, quoted, words = m.groups()
+      if op:
+         res.append(op)
+      elif quoted is not None:
+         res.append(('quoted', quoted.replace('""', '"')))
+      else:
+         # keywords split sequence of words
+         term = []
+         for w in words.split():
+            if w in KEYWORDS:
+               if term: res.append(('term', ' '.join(term)))
+               res.append(KEYWORDS[w])
+               term = []
+            elif w.startswith(FILTERS) and term:
+               res.append(('term', ' '.join(term)))
+               term = [w]
+            else:
+               term.append(w)
+         if term: res.append(('term', ' '.join(term)))
+   return res
+
+def parse(text):
+   "Get syntax tree for the query, None if query is empty"
+   tokens = tokenize(text)
+   if not tokens: return None
+   node, pos = parseOr(tokens, 0)
+   if pos < len(tokens): raise ValueError("Unexpected '%s'" % tokens[pos])
+   return node
+
+def parseOr(tokens, pos):
+   "expr | expr"
+   items = []
+   while True:
+      node, pos = parseAnd(tokens, pos)
+      items.append(node)
+      if pos < len(tokens) and tokens[pos] == '|':
+         pos += 1
+      else:
+         break
+   return group('or', items), pos
+
+def parseAnd(tokens, pos):
+   "expr , expr"
+   items = []
+   while True:
+      node, pos = parseNot(tokens, pos)
+      items.append(node)
+      if pos < len(tokens) and tokens[pos] in (',', '&'):
+         pos += 1
+         # allow 'cat, ' at the end
+         if tokens[pos-1] == ',' and (pos == len(tokens) or tokens[pos] in (')', '|')): break
+      elif not(pos < len(tokens) and (tokens[pos] in ('(', '!') or isinstance(tokens[pos], tuple))):
+         break
+   return group('and', items), pos
+
+def parseNot(tokens, pos):
+   "! expr"
+   if pos == len(tokens): raise ValueError("Unexpected end of query")
+   tok = tokens[pos]
+   if tok == '!':
+      node, pos = parseNot(tokens, pos+1)
+      return ('not', node), pos
+   if tok == '(':
+      node, pos = parseOr(tokens, pos+1)
+      if pos == len(tokens) or tokens[pos] != ')': raise ValueError("Missing ')'")
+      return node, pos+1
+   if isinstance(tok, tuple):
+      return (term(tok[1]) if tok[0] == 'term' else ('tag', tok[1].lower())), pos+1
+   raise ValueError("Unexpected '%s'" % tok)
+
+def group(op, items):
+   "Join items with operation, flat the nested groups"
+   if len(items) == 1: return items[0]
+   res = []
+   for it in items:
+      res.extend(it[1] if it[0] == op else [it])
+   return (op, res)
+
+def term(text):
+   "Define type of the term"
+   text = text.strip()
+   for key in ('in', 'ext', 'name'):
+      if text.startswith(key + ':'):
+         val = text[len(key)+1:].strip()
+         if key == 'ext': val = val.lstrip('.').lower()
+         return (key, val)
+   if text.startswith('?'):
+      return ('name', text[1:].strip())
+   if text.endswith('*'):
+      return ('prefix', text[:-1].strip().lower())
+   return ('tag', text.lower())
+
+def quote(tag):
+   "Tag as a query term, in quotes if it has special symbols"
+   if tokenize(tag) == [('term', tag)] and term(tag) == ('tag', tag.lower()):
+      return tag
+   return '"%s"' % tag.replace('"', '""')
+
+def escape(s):
+   "Escape special symbols for LIKE"
+   return s.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def prefixRange(p):
+   "Parameters for t_name >= ? AND t_name < ?"
+   return (p, p[:-1] + chr(ord(p[-1]) + 1))
+
+class Planner:
+   "Build SQL statement for the query, order terms using tag statistics"
+
+   def __init__(self, db, dirs):
+      self.dirs = dirs   # DirTree
+      self.cursor = db.cursor()
+      self.cursor.execute("SELECT MAX(fid) FROM files")
+      self.total = self.cursor.fetchone()[0] or 1
+      self.tags = {}   # name : (tid, number of files)
+
+   def tagInfo(self, name):
+      "Get id and cardinality of the tag"
+      if name not in self.tags:
+         self.cursor.execute("SELECT tid, t_usage FROM tags WHERE t_name=?", (name,))
+         self.tags[name] = self.cursor.fetchone() or (-1, 0)
+      return self.tags[name]
+
+   def prefixCount(self, p):
+      "Number of links for tags with the prefix"
+      if not p:
+         self.cursor.execute("SELECT COUNT(DISTINCT fid) FROM filetags")
+      else:
+         self.cursor.execute("SELECT SUM(t_usage) FROM tags "
+                             "WHERE t_name >= ? AND t_name < ?", prefixRange(p))
+      return self.cursor.fetchone()[0] or 0
+
+   def condition(self, node):
+      "Get (sql, parameters, probability) for the node"
+      kind, val = node
+      if kind == 'tag':
+         tid, num = self.tagInfo(val)
+         if tid == -1: return ("0", [], 0.0)
+         return ("EXISTS (SELECT 1 FROM filetags WHERE fid = f.fid AND tid = ?)", [tid],
+                 num / self.total)
+      if kind == 'prefix':
+         p = min(1.0, self.prefixCount(val) / self.total)
+         if not val:
+            return ("EXISTS (SELECT 1 FROM filetags WHERE fid = f.fid)", [], p)
+         return ("EXISTS (SELECT 1 FROM filetags ft JOIN tags t ON t.tid = ft.tid "
+                 "WHERE ft.fid = f.fid AND t.t_name >= ? AND t.t_name < ?)",
+                 list(prefixRange(val)), p)
+      if kind == 'in':
+         did = self.dirs.find(val)
+         if did == -1: return ("0", [], 0.0)
+         return ("f." + SUBTREE, [did], GUESS[kind])
+      if kind == 'ext':
+         return ("f.f_name LIKE ? ESCAPE '\\'", ['%.' + escape(val)], GUESS[kind])
+      if kind == 'name':
+         return ("f.f_name LIKE ? ESCAPE '\\'", ['%' + escape(val) + '%'], GUESS[kind])
+      if kind == 'not':
+         sql, par, p = self.condition(val)
+         return ("NOT (" + sql + ")", par, 1.0 - p)
+      # 'and' / 'or'
+      parts = [self.condition(n) for n in val]
+      if kind == 'and':
+         # the most selective first
+         parts.sort(key=lambda x: x[2])
+         p = 1.0
+         for x in parts: p *= x[2]
+      else:
+         # the most probable first
+         parts.sort(key=lambda x: -x[2])
+         p = min(1.0, sum(x[2] for x in parts))
+      sql = (' %s ' % kind.upper()).join('(%s)' % x[0] for x in parts)
+      return ('(' + sql + ')', [v for x in parts for v in x[1]], p)
+
+   def plan(self, node):
+      "Get (sql, parameters) for the node, None if result is empty"
+      items = node[1] if node[0] == 'and' else [node]
+      # find the rarest tag
+      driver, best = None, None
+      for it in items:
+         if it[0] == 'tag':
+            tid, num = self.tagInfo(it[1])
+            if tid == -1: return None
+            if best is None or num < best:
+               driver, best = it, num
+      if driver is None:
+         sql, par, p = self.condition(node)
+         if sql == "0": return None
+         return ("SELECT f.did, f.f_name FROM files f WHERE " + sql, par)
+      # read only the files of the rarest tag, check the rest for each of them
+      rest = [it for it in items if it is not driver]
+      sql = ("SELECT f.did, f.f_name FROM filetags d CROSS JOIN files f ON f.fid = d.fid "
+             "WHERE d.tid = ?")
+      par = [self.tagInfo(driver[1])[0]]
+      if rest:
+         cond, cpar, p = self.condition(group('and', rest))
+         if cond == "0": return None
+         sql += " AND (" + cond + ")"
+         par += cpar
+      return (sql, par)
@@ -0,0 +1,161 @@
+"""
+Time measurement for the Tk event handlers
+
+Tracer.start() replaces tkinter.CallWrapper, so all the callbacks
+registered after it (bind, tag_bind, after, menu commands) are measured.
+A watchdog thread finds stalls of the main loop and saves the Python
+stack of the blocked thread. Events can be saved in the Chrome trace
+format, open it in chrome://tracing or https://ui.perfetto.dev.
+"""
+
+import os
+import sys
+import json
+import time
+import tkinter
+import threading
+import traceback
+from collections import deque
+
+from .profiler import Stats, BOUNDS, table
+
+STALL = 0.2       # s, main loop is blocked
+PERIOD = 0.05     # s, heartbeat and watchdog check
+EVENTS = 200000   # number of saved events
+STALLS = 100      # number of saved stalls
+
+CallWrapper = tkinter.CallWrapper   # original
+
+def handlerName(func):
+   "Readable name of the callback"
+   if hasattr(func, '__self__'):
+      return "%s.%s" % (type(func.__self__).__name__, func.__name__)
+   code = getattr(func, '__code__', None)
+   if code is None:
+      return type(func).__name__
+   if code.co_name == 'callit' and func.__closure__:
+      # function wrapper made by after()
+      for cell in func.__closure__:
+         if callable(cell.cell_contents): return handlerName(cell.cell_contents)
+   if code.co_name == '<lambda>':
+      return "lambda %s:%d" % (os.path.basename(code.co_filename), code.co_firstlineno)
+   return func.__qualname__
+
+def eventType(ev):
+   "Name of the event type"
+   tp = getattr(ev, 'type', None)
+   return getattr(tp, 'name', None) or str(tp or 'event')
+
+class TracedCall(CallWrapper):
+   "Callback which is measured by the tracer"
+   tracer = None
+
+   def __call__(self, *args):
+      tracer = TracedCall.tracer
+      if tracer is None: return CallWrapper.__call__(self, *args)
+      t = time.perf_counter()
+      kind = 'callback'
+      try:
+         if self.subst:
+            args = self.subst(*args)
+            kind = eventType(args[0]) if args else 'event'
+         return self.func(*args)
+      except SystemExit:
+         raise
+      except:
+         self.widget._report_exception()
+      finally:
+         tracer.event(self.func, kind, t, time.perf_counter() - t)
+
+class Tracer:
+   "Statistics for event handlers, watchdog for main loop stalls"
+
+   def __init__(self, root, stall=STALL, period=PERIOD):
+      self.root = root
+      self.stall = stall
+      self.period = period
+      self.handlers = {}   # 'name type' : Stats
+      self.events = deque(maxlen=EVENTS)   # (name, type, start, duration)
+      self.stalls = deque(maxlen=STALLS)
+      self.current = None   # stall which is not finished
+      self.lock = threading.Lock()
+      self.stopped = threading.Event()
+      self.t0 = self.beat = time.perf_counter()
+      self.thread = threading.get_ident()   # Tk thread
+
+   def start(self):
+      "Measure new callbacks, run watchdog"
+      TracedCall.tracer = self
+      tkinter.CallWrapper = TracedCall
+      self.root.after(int(self.period * 1000), self.heartbeat)
+      threading.Thread(target=self.watch, daemon=True).start()
+      return self
+
+   def stop(self):
+      "Stop measurement"
+      self.stopped.set()
+      TracedCall.tracer = None
+      tkinter.CallWrapper = CallWrapper
+
+   def event(self, func, kind, start, dt):
+      "Save callback execution"
+      name = handlerName(func)
+      if name == 'Tracer.heartbeat': return
+      with self.lock:
+         self.handlers.setdefault(name + ' ' + kind, Stats()).add(dt, 0)
+         self.events.append((name, kind, start, dt))
+
+   def heartbeat(self):
+      "Main loop is alive"
+      self.beat = time.perf_counter()
+      with self.lock:
+         if self.current:
+            self.current['duration'] = self.beat - self.current['start']
+            self.current = None
+      if not self.stopped.is_set():
+         self.root.after(int(self.period * 1000), self.heartbeat)
+
+   def watch(self):
+      "Check heartbeat, save stack when it is late"
+      while not self.stopped.wait(self.period):
+         beat = self.beat
+         idle = time.perf_counter() - beat
+         if idle < self.stall: continue
+         with self.lock:
+            if self.current is None and self.beat == beat:
+               frame = sys._current_frames().get(self.thread)
+               self.current = {'start': beat, 'duration': idle,
+                               'stack': traceback.format_stack(frame) if frame else []}
+               self.stalls.append(self.current)
+            elif self.current:
+               self.current['duration'] = idle
+
+   def report(self, top=30):
+      "Get statistics as text"
+      with self.lock:
+         items = {k: v.dump() for k, v in self.handlers.items()}
+         stalls = list(self.stalls)
+      res = ["Histogram bounds, ms: " + ' '.join('%g' % (b * 1000) for b in BOUNDS)]
+      res += table("Handlers", items, top)
+      res.append("\nStalls (%g ms and more)" % (self.stall * 1000))
+      for s in reversed(stalls):
+         res.append("at %.1f s, %.1f ms" % (s['start'] - self.t0, s['duration'] * 1000))
+         res.extend("   " + line.rstrip().replace('\n', '\n   ') for line in s['stack'][-8:])
+      return '\n'.join(res)
+
+   def export(self, fname):
+      "Save events in Chrome trace format"
+      pid = os.getpid()
+      with self.lock:
+         events, stalls = list(self.events), list(self.stalls)
+      res = [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': 1, 'args': {'name': 'Tk'}},
+             {'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': 2, 'args': {'name': 'stalls'}}]
+      for name, kind, start, dt in events:
+         res.append({'name': name, 'cat': kind, 'ph': 'X', 'pid': pid, 'tid': 1,
+                     'ts': (start - self.t0) * 1e6, 'dur': dt * 1e6})
+      for s in stalls:
+         res.append({'name': 'stall', 'cat': 'stall', 'ph': 'X', 'pid': pid, 'tid': 2,
+                     'ts': (s['start'] - self.t0) * 1e6, 'dur': s['duration'] * 1e6,
+                     'args': {'stack': ''.join(s['stack'])}})
+      with open(fname, 'w') as f:
+         json.dump({'traceEvents': res, 'displayTimeUnit': 'ms'}, f)
@@ -0,0 +1,190 @@
+"""
+Copy and move files in background
+"""
+
+import os
+import time
+import errno
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+BLOCK = 8 * 1024 * 1024   # bytes copied at once
+
+# kernel copy is not supported for this pair of files
+UNSUPPORTED = (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTSUP)
+
+class Cancelled(Exception):
+   "Job was stopped by user"
+   pass
+
+class Job:
+   "Copy or move of one file (folder)"
+
+   def __init__(self, src, dst, move=False):
+      self.src = src       # source path
+      self.dst = dst       # full destination path
+      self.move = move
+      self.total = 0       # bytes
+      self.done = 0
+      self.start = time.monotonic()
+      self.cancelled = False
+      self.finished = False
+      self.error = None
+      self.landed = []     # (is_dir, src, dst) which are not saved in base yet
+      self.lock = threading.Lock()
+
+   def land(self, is_dir, src, dst):
+      "Element is in the new place"
+      with self.lock:
+         self.landed.append((is_dir, src, dst))
+
+   def take(self):
+      "Get and forget list of landed elements"
+      with self.lock:
+         res, self.landed = self.landed, []
+      return res
+
+   def cancel(self):
+      "Stop after the current block"
+      self.cancelled = True
+
+   def check(self):
+      "Raise exception if cancelled"
+      if self.cancelled: raise Cancelled()
+
+   def progress(self):
+      "Get (percent, bytes per second)"
+      dt = time.monotonic() - self.start
+      return (100 * self.done // self.total if self.total else 0,
+              self.done / dt if dt > 0 else 0)
+
+class TransferQueue:
+   "Run jobs on the thread pool"
+
+   def __init__(self, workers=2):
+      self.pool = ThreadPoolExecutor(max_workers=workers)
+      self.jobs = []
+
+   def submit(self, job):
+      "Add job to the queue"
+      self.jobs.append(job)
+      self.pool.submit(run, job)
+      return job
+
+   def finished(self):
+      "Remove and return finished jobs"
+      res = [j for j in self.jobs if j.finished]
+      self.jobs = [j for j in self.jobs if not j.finished]
+      return res
+
+   def cancel(self):
+      "Stop all jobs"
+      for j in self.jobs: j.cancel()
+
+   def close(self):
+      "Cancel jobs and wait for the threads"
+      self.cancel()
+      self.pool.shutdown(wait=True)
+
+def run(job):
+   "Execute the job"
+   try:
+      if job.move and rename(job):
+         pass
+      elif os.path.isdir(job.src) and not os.path.islink(job.src):
+         copyTree(job)
+      else:
+         job.total = os.path.getsize(job.src)
+         copyEntry(job, job.src, job.dst)
+         job.land(False, job.src, job.dst)
+         if job.move: os.remove(job.src)
+   except Cancelled:
+      pass
+   except OSError as e:
+      job.error = e
+   finally:
+      job.finished = True
+
+def rename(job):
+   "Move inside the same file system, return False if not possible"
+   try:
+      os.rename(job.src, job.dst)
+   except OSError as e:
+      if e.errno == errno.EXDEV: return False
+      raise
+   job.land(os.path.isdir(job.dst), job.src, job.dst)
+   return True
+
+def copyTree(job):
+   "Copy folder file by file"
+   files = []
+   for path, dirs, names in os.walk(job.src):
+      job.check()
+      # links to folders are copied as links
+      names += [d for d in dirs if os.path.islink(os.path.join(path, d))]
+      for nm in names:
+         src = os.path.join(path, nm)
+         files.append(src)
+         if not os.path.islink(src): job.total += os.path.getsize(src)
+   made = set()
+   for src in files:
+      dst = job.dst + src[len(job.src):]
+      folder = os.path.dirname(dst)
+      if folder not in made:
+         os.makedirs(folder, exist_ok=True)
+         made.add(folder)
+      copyEntry(job, src, dst)
+      job.land(False, src, dst)
+      if job.move: os.remove(src)
+   # empty folders and attributes
+   for path, dirs, names in os.walk(job.src, topdown=False):
+      dst = job.dst + path[len(job.src):]
+      os.makedirs(dst, exist_ok=True)
+      shutil.copystat(path, dst)
+      if job.move: os.rmdir(path)
+
+def copyEntry(job, src, dst):
+   "Copy file or link, remove incomplete file on error"
+   job.check()
+   if os.path.islink(src):
+      os.symlink(os.readlink(src), dst)
+      return
+   try:
+      with open(src, 'rb') as fin, open(dst, 'wb') as fout:
+         for n in blocks(fin.fileno(), fout.fileno()):
+            job.done += n
+            job.check()
+      shutil.copystat(src, dst)
+   except BaseException:
+      try:
+         os.remove(dst)
+      except OSError:
+         pass
+      raise
+
+def blocks(fi, fo):
+   "Copy data, yield size of each block"
+   calls = []
+   if hasattr(os, 'copy_file_range'):
+      calls.append(lambda: os.copy_file_range(fi, fo, BLOCK))
+   if hasattr(os, 'sendfile'):
+      calls.append(lambda: os.sendfile(fo, fi, None, BLOCK))
+   for call in calls:
+      try:
+         n = call()
+      except OSError as e:
+         if e.errno in UNSUPPORTED: continue   # try the next method
+         raise
+      while n > 0:
+         yield n
+         n = call()
+      return
+   # user space copy
+   while True:
+      data = memoryview(os.read(fi, BLOCK))
+      if not data: break
+      n = len(data)
+      while data:
+         data = data[os.write(fo, data):]
+      yield n
@@ -0,0 +1,84 @@
+"""
+Move files to trash according to the freedesktop.org specification
+"""
+
+import os
+import stat
+import time
+from urllib.parse import quote
+
+def homeTrash():
+   "Trash folder in the user home"
+   data = os.environ.get('XDG_DATA_HOME') or os.path.expanduser('~/.local/share')
+   return os.path.join(data, 'Trash')
+
+def mountPoint(path):
+   "Top directory of the file system"
+   path = os.path.realpath(path)
+   while not os.path.ismount(path):
+      path = os.path.dirname(path)
+   return path
+
+def topTrash(top):
+   "Trash folder on other device, create if need"
+   uid = str(os.getuid())
+   # shared trash, must be sticky and not a link
+   shared = os.path.join(top, '.Trash')
+   try:
+      st = os.lstat(shared)
+      if stat.S_ISDIR(st.st_mode) and st.st_mode & stat.S_ISVTX:
+         return os.path.join(shared, uid)
+   except OSError:
+      pass
+   return os.path.join(top, '.Trash-' + uid)
+
+class Trash:
+   "Trash folders for different devices"
+
+   def __init__(self):
+      self.home = homeTrash()
+      self.dirs = {}   # device : (trash folder, top directory or None)
+
+   def folder(self, path):
+      "Get (trash folder, top directory) for the file"
+      dev = os.lstat(path).st_dev
+      if dev not in self.dirs:
+         home = self.home
+         while not os.path.exists(home): home = os.path.dirname(home)
+         if os.stat(home).st_dev == dev:
+            self.dirs[dev] = (self.home, None)
+         else:
+            top = mountPoint(os.path.dirname(os.path.abspath(path)))
+            self.dirs[dev] = (topTrash(top), top)
+      trash, top = self.dirs[dev]
+      for sub in ('files', 'info'):
+         os.makedirs(os.path.join(trash, sub), mode=0o700, exist_ok=True)
+      return trash, top
+
+   def put(self, path):
+      "Move file (folder) to trash"
+      path = os.path.abspath(path)
+      trash, top = self.folder(path)
+      # relative path for the top directory trash
+      orig = os.path.relpath(path, top) if top else path
+      info = ("[Trash Info]\nPath=%s\nDeletionDate=%s\n" %
+              (quote(orig), time.strftime('%Y-%m-%dT%H:%M:%S')))
+      base = os.path.basename(path)
+      root, ext = os.path.splitext(base)
+      name, n = base, 1
+      # reserve the name
+      while True:
+         info_path = os.path.join(trash, 'info', name + '.trashinfo')
+         try:
+            fd = os.open(info_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+            break
+         except FileExistsError:
+            n += 1
+            name = "%s.%d%s" % (root, n, ext)
+      with os.fdopen(fd, 'w') as f:
+         f.write(info)
+      try:
+         os.rename(path, os.path.join(trash, 'files', name))
+      except OSError:
+         os.remove(info_path)
+         raise
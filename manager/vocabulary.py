@@ -0,0 +1,88 @@
+"""
+Tag names in memory for fast completion
+"""
+
+import re
+from bisect import bisect_left, insort
+
+LIMIT = 50   # maximal number of variants
+
+class Vocabulary:
+   "Sorted list of tags with number of files for each of them"
+
+   def __init__(self):
+      self.names = []   # sorted tag names
+      self.usage = {}   # name : number of files
+
+   def load(self, rows):
+      "Fill from (name, usage) pairs"
+      self.usage = dict(rows)
+      self.names = sorted(self.usage)
+
+   def set(self, name, usage):
+      "Add tag or change its usage"
+      if name not in self.usage: insort(self.names, name)
+      self.usage[name] = usage
+
+   def remove(self, name):
+      "Forget tag"
+      if self.usage.pop(name, None) is None: return
+      del self.names[bisect_left(self.names, name)]
+
+   def __iter__(self):
+      return iter(self.names)
+
+   def __len__(self):
+      return len(self.names)
+
+   def rank(self, names):
+      "The most used first"
+      return sorted(names, key=lambda t: (-self.usage[t], t))
+
+   def prefix(self, start, limit=LIMIT):
+      "Tags which start with the given text"
+      if not start: return []
+      i = bisect_left(self.names, start)
+      j = bisect_left(self.names, start[:-1] + chr(ord(start[-1]) + 1))
+      return self.rank(self.names[i:j])[:limit]
+
+   def fuzzy(self, text, limit=LIMIT):
+      "Tags which contain letters of the text in the same order"
+      if not text: return []
+      pattern = re.compile('.*?'.join(map(re.escape, text)))
+      found = []
+      for t in self.names:
+         m = pattern.search(t)
+         # compact matches first
+         if m: found.append((m.end() - m.start(), -self.usage[t], t))
+      found.sort()
+      return [f[2] for f in found[:limit]]
+
+   def complete(self, start, limit=LIMIT):
+      "Variants for the word, prefix matches or fuzzy if there are no such"
+      start = start.lower()
+      return self.prefix(start, limit) or self.fuzzy(start, limit)
+
+class Completer:
+   "Change the last word in comma separated list, repeat to get the next variant"
+
+   def __init__(self, vocab):
+      self.vocab = vocab
+      self.variants = []
+      self.num = 0
+
+   def next(self, text):
+      "Get text with completed last word, None if no variants"
+      tag_lst = [s.strip() for s in text.split(',')]
+      start = tag_lst[-1]
+      if start == "": return None
+      if self.variants and start == self.variants[self.num]:
+         # not first key press for current word
+         self.num = (self.num + 1) % len(self.variants)
+      else:
+         # first key press
+         self.variants = self.vocab.complete(start)
+         if not self.variants: return None
+         self.num = 0
+      tag_lst[-1] = self.variants[self.num]
+      return ', '.join(tag_lst)
@@ -0,0 +1,128 @@
+"""
+Notification about changes in the shown folders
+"""
+
+import os
+import struct
+import ctypes
+import ctypes.util
+
+# inotify constants
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+
+MASK = (IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE |
+        IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+EVENT = struct.Struct('iIII')   # wd, mask, cookie, len
+
+# change types
+ADD, DEL, RELOAD = 'add', 'del', 'reload'
+
+def loadInotify():
+   "Get libc with inotify functions or None"
+   try:
+      libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+      libc.inotify_init1, libc.inotify_add_watch, libc.inotify_rm_watch
+   except (OSError, AttributeError):
+      return None
+   return libc
+
+class DirWatcher:
+   "Watch list of folders, use inotify or check modification time"
+
+   def __init__(self):
+      self.paths = {}   # key : path
+      self.wd = {}      # path : watch descriptor or (mtime, names)
+      self.fd = -1
+      self.libc = loadInotify()
+      if self.libc:
+         self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+         if self.fd < 0: self.libc = None
+
+   def watch(self, key, path):
+      "Watch path for the given client"
+      old = self.paths.get(key)
+      # watch is removed by kernel when folder is deleted, add it again
+      if old == path and path in self.wd: return
+      self.paths[key] = path
+      if old is not None and old not in self.paths.values():
+         self.forget(old)
+      if path in self.wd: return
+      if self.libc:
+         wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), MASK)
+         if wd >= 0: self.wd[path] = wd
+      else:
+         self.wd[path] = snapshot(path)
+
+   def forget(self, path):
+      "Stop watching path"
+      wd = self.wd.pop(path, None)
+      if self.libc and wd is not None and wd not in self.wd.values():
+         self.libc.inotify_rm_watch(self.fd, wd)
+
+   def changes(self):
+      "Get dictionary {path: [(type, name)]} with changes since the last call"
+      return self.readEvents() if self.libc else self.checkTime()
+
+   def readEvents(self):
+      "Parse inotify events"
+      res = {}
+      paths = {wd: p for p, wd in self.wd.items()}
+      while True:
+         try:
+            buf = os.read(self.fd, 65536)
+         except BlockingIOError:
+            break
+         pos = 0
+         while pos < len(buf):
+            wd, mask, cookie, size = EVENT.unpack_from(buf, pos)
+            name = os.fsdecode(buf[pos+EVENT.size:pos+EVENT.size+size].rstrip(b'\0'))
+            pos += EVENT.size + size
+            if mask & IN_Q_OVERFLOW:
+               for p in paths.values(): res.setdefault(p, []).append((RELOAD, ''))
+               continue
+            path = paths.get(wd)
+            if path is None: continue
+            if mask & (IN_DELETE_SELF | IN_MOVE_SELF | IN_IGNORED):
+               res.setdefault(path, []).append((RELOAD, ''))
+               if mask & IN_IGNORED and self.wd.get(path) == wd: del self.wd[path]
+            elif mask & (IN_DELETE | IN_MOVED_FROM):
+               res.setdefault(path, []).append((DEL, name))
+            else:
+               res.setdefault(path, []).append((ADD, name))
+      return res
+
+   def checkTime(self):
+      "Compare folder content if modification time was changed"
+      res = {}
+      for path, (mtime, names) in list(self.wd.items()):
+         try:
+            if os.stat(path).st_mtime_ns == mtime: continue
+         except OSError:
+            res[path] = [(RELOAD, '')]
+            continue
+         self.wd[path] = snapshot(path)
+         new = self.wd[path][1]
+         res[path] = [(DEL, n) for n in names - new] + [(ADD, n) for n in new - names]
+      return res
+
+   def close(self):
+      "Free resources"
+      if self.fd >= 0: os.close(self.fd)
+      self.fd = -1
+
+def snapshot(path):
+   "Modification time and set of names"
+   try:
+      return os.stat(path).st_mtime_ns, set(os.listdir(path))
+   except OSError:
+      return None, set()
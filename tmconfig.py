@@ -5,8 +5,34 @@ programs = {
 #   program :  file types
 'ristretto' : ['jpg', 'bmp', 'png'],
 'evince'    : ['pdf', 'djv', 'djvu'],
+#'mpv'      : ['video/*'],   MIME types are also possible
 }
 
-# deletion 
-delete = 'gvfs-trash'
+# arguments to open file in the already running program
+reuse = {
+#'eog' : ['--single-window'],
+}
+
+# maximal number of programs started by manager
+max_programs = 8
+
+# deletion: program like 'gio trash', None - move to trash without external program
+delete = None
+
+# database file, None - manager/db/tags.db (can be changed by TAGMANAGER_DB)
+db_path = None
+
+# number of simultaneous copy/move operations
+transfer_workers = 2
+
+# measure database queries from the start, see Tags menu
+profile_queries = False
+
+# s, queries which are slower are saved with their plans
+slow_query = 0.05
+
+# file for Chrome trace of the window events, None - no tracing
+trace_ui = None
 
+# s, the window is blocked, save the Python stack
+ui_stall = 0.2